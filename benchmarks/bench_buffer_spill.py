@@ -0,0 +1,47 @@
+""" Cost of Buffer appends that spill, as the number of buffered keys grows
+
+    python benchmarks/bench_buffer_spill.py [max-exponent]
+
+Fills a Buffer with 10**3 ... 10**max-exponent keys until memory is full and
+then times appends to random keys, each of which makes the buffer spill.
+Victims come either from the heap the Buffer maintains or, for comparison,
+from ``keys_to_flush`` over all keys, which is what Buffer used to do.  The
+slow partd is a ``Dict`` so that we measure victim selection, not disk.  The
+default max exponent is 5.
+"""
+import random
+import sys
+from timeit import default_timer as time
+
+from partd import Buffer, Dict
+from partd.buffer import keys_to_flush
+
+
+class ScanningBuffer(Buffer):
+    def _keys_to_flush(self, fraction=0.1, maxcount=100000):
+        return keys_to_flush(self.lengths, fraction, maxcount)
+
+
+def bench(cls, nkeys, nappends=2000, size=100):
+    p = cls(Dict(), Dict(), available_memory=nkeys * size)
+    for i in range(0, nkeys, 10000):
+        p.append({k: b'x' * size for k in range(i, min(i + 10000, nkeys))})
+    rng = random.Random(0)
+    keys = [rng.randrange(nkeys) for i in range(nappends)]
+    start = time()
+    for k in keys:
+        p.append({k: b'x' * size})
+    return (time() - start) / nappends
+
+
+def main(max_exponent=5):
+    print('%10s %14s %14s' % ('nkeys', 'heap', 'keys_to_flush'))
+    for exponent in range(3, int(max_exponent) + 1):
+        nkeys = 10 ** exponent
+        print('%10d %11.1f us %11.1f us'
+              % (nkeys, bench(Buffer, nkeys) * 1e6,
+                 bench(ScanningBuffer, nkeys) * 1e6))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
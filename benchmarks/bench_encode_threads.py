@@ -0,0 +1,41 @@
+""" Throughput of compressed appends and gets with several threads
+
+    python benchmarks/bench_encode_threads.py [nthreads ...]
+
+Appends 1000 keys of 256 kB of compressible bytes to a ``ZLib`` over a
+``Dict`` in one call and gets them back in one call, so that we time the
+codec rather than storage.  zlib releases the GIL, so with ``nthreads``
+threads encoding and decoding should scale with the number of cores.  The
+default is to compare 1, 2, 4 and 8 threads.
+"""
+import os
+import sys
+from timeit import default_timer as time
+
+from partd import Dict
+from partd.compressed import ZLib
+
+
+def bench(nthreads, nkeys=1000, size=2**18):
+    block = os.urandom(size // 8)
+    data = {i: block * 8 for i in range(nkeys)}
+    nbytes = nkeys * size
+    with ZLib(Dict(), nthreads=nthreads) as p:
+        start = time()
+        p.append(data)
+        append = time() - start
+        start = time()
+        p.get(list(data))
+        get = time() - start
+    return nbytes / append / 1e6, nbytes / get / 1e6
+
+
+def main(*nthreads):
+    print('%8s %14s %14s' % ('nthreads', 'append', 'get'))
+    for n in map(int, nthreads or (1, 2, 4, 8)):
+        append, get = bench(n)
+        print('%8d %9.0f MB/s %9.0f MB/s' % (n, append, get))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
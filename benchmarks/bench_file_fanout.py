@@ -0,0 +1,47 @@
+""" Cost of File append and get as the number of keys grows, flat or sharded
+
+    python benchmarks/bench_file_fanout.py [max-exponent] [directory]
+
+Measures the time per key of appending to, and then reading, every one of
+10**3 ... 10**max-exponent keys, once with all files in one directory and
+once fanned out over two levels of hashed subdirectories.  The default max
+exponent is 5.  Pass 6 for the full million-key run, which needs a few GB of
+disk and some patience.
+"""
+import sys
+from timeit import default_timer as time
+
+from partd import File
+
+
+def bench(nkeys, fanout, dir=None, batch=10000):
+    keys = [('part', i) for i in range(nkeys)]
+    with File(dir=dir, fanout=fanout) as p:
+        start = time()
+        for i in range(0, nkeys, batch):
+            p.append({k: b'x' * 100 for k in keys[i:i + batch]})
+        append = time() - start
+
+        start = time()
+        for i in range(0, nkeys, batch):
+            p.get(keys[i:i + batch])
+        get = time() - start
+
+        start = time()
+        p.drop()
+        drop = time() - start
+    return append / nkeys, get / nkeys, drop
+
+
+def main(max_exponent=5, dir=None):
+    print('%10s %7s %12s %12s %10s' % ('nkeys', 'fanout', 'append/key',
+                                        'get/key', 'drop'))
+    for exponent in range(3, int(max_exponent) + 1):
+        for fanout in [0, 2]:
+            append, get, drop = bench(10 ** exponent, fanout, dir)
+            print('%10d %7d %10.1f us %10.1f us %8.3f s'
+                  % (10 ** exponent, fanout, append * 1e6, get * 1e6, drop))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,41 @@
+""" Compare serial and threaded reads of many keys from a File partd
+
+    python benchmarks/bench_file_get.py [directory]
+
+Pass a directory on the storage of interest, like an NVMe drive or a network
+file system.  The page cache is not dropped between runs, so results for
+local disks mostly measure system call overhead.
+"""
+import sys
+from timeit import default_timer as time
+
+from partd import File
+
+
+def bench(p, keys, nthreads, repeat=3):
+    p.nthreads = nthreads
+    p._executor = None
+    best = float('inf')
+    for _ in range(repeat):
+        start = time()
+        p.get(keys)
+        best = min(best, time() - start)
+    return best
+
+
+def main(dir=None):
+    cases = [('many small keys', 5000, 1000),
+             ('few large keys', 8, 64 * 2**20)]
+    for name, nkeys, nbytes in cases:
+        with File(dir=dir) as p:
+            keys = list(range(nkeys))
+            p.append({k: b'x' * nbytes for k in keys})
+            print('%s: %d keys of %d bytes' % (name, nkeys, nbytes))
+            for nthreads in [1, 2, 4, 8, 16]:
+                duration = bench(p, keys, nthreads)
+                print('  nthreads=%-2d %8.3f s %10.1f MB/s'
+                      % (nthreads, duration, nkeys * nbytes / duration / 1e6))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
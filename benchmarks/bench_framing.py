@@ -0,0 +1,84 @@
+""" Bytes copied per appended byte on the way through Encode
+
+    python benchmarks/bench_framing.py [megabytes]
+
+Appends large values through an ``Encode`` and gets them back, tracing
+allocations with ``tracemalloc``.  We report the peak of memory allocated
+while appending a value to a new key, per byte appended, and while getting
+a key that was appended to eight times, per byte returned.  Values are
+encoded and decoded as they are, so that we see the copies made by framing
+and by the partd underneath.  For comparison ``CopyingEncode`` frames values
+with ``struct.pack(...) + bytes`` and splits them by slicing, as Encode used
+to.  The default value size is 64 MB.
+"""
+import struct
+import sys
+import tracemalloc
+
+from partd import Dict, Encode, File
+
+
+def identity(x):
+    return x
+
+
+def old_frame(bytes):
+    return struct.pack('Q', len(bytes)) + bytes
+
+
+def old_framesplit(bytes):
+    i = 0; n = len(bytes)
+    while i < n:
+        nbytes = struct.unpack('Q', bytes[i:i+8])[0]
+        i += 8
+        yield bytes[i: i + nbytes]
+        i += nbytes
+
+
+class CopyingEncode(Encode):
+    def append(self, data, **kwargs):
+        data = {k: old_frame(self.encode(v)) for k, v in data.items()}
+        self.partd.append(data, **kwargs)
+
+    def _unframe(self, chunk):
+        return self.join([self.decode(f) for f in old_framesplit(chunk)])
+
+
+def traced(func, *args, **kwargs):
+    """ Peak of bytes allocated while calling func """
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        del result
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench(cls, make_partd, size, npieces=8, **get_kwargs):
+    piece = b'x' * (size // npieces)
+    with cls(identity, identity, b''.join, make_partd()) as p:
+        append = max(traced(p.append, {('x', i): piece})
+                     for i in range(npieces))
+        for i in range(npieces):
+            p.append({'y': piece})
+        get = traced(p.get, ['y'], **get_kwargs)
+    return append / len(piece), get / (len(piece) * npieces)
+
+
+def main(megabytes=64):
+    size = int(float(megabytes) * 2**20)
+    print('%-32s %10s %10s' % ('', 'append', 'get'))
+    for name, make_partd, get_kwargs in [('File', File, {}),
+                                         ('Dict', Dict, {}),
+                                         ('Dict, copy=False', Dict,
+                                          {'copy': False})]:
+        for cls in [CopyingEncode, Encode]:
+            append, get = bench(cls, make_partd, size, **get_kwargs)
+            print('%-32s %6.2f B/B %6.2f B/B'
+                  % ('%s %s' % (cls.__name__, name), append, get))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,40 @@
+""" Cost of loading small values that msgpack can not serialize
+
+    python benchmarks/bench_python_loads.py [nframes]
+
+Serializes many small lists holding a complex number, which msgpack can
+not serialize and so go to pickle, and loads them back.  We compare
+``partd.python.loads`` on tagged values with loading them as older versions
+did, trying msgpack first and falling back to pickle on any exception.  The
+default is 100000 values.
+"""
+import pickle
+import sys
+from timeit import default_timer as time
+
+from partd.python import dumps, loads, loads_untagged
+
+
+def bench(nframes=100000):
+    values = [[i, 1j] for i in range(int(nframes))]
+    untagged = [pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+                for v in values]
+    tagged = list(map(dumps, values))
+
+    start = time()
+    list(map(loads_untagged, untagged))
+    old = time() - start
+    start = time()
+    list(map(loads, tagged))
+    new = time() - start
+    return old / len(values), new / len(values)
+
+
+def main(nframes=100000):
+    old, new = bench(nframes)
+    print('untagged, msgpack then pickle  %6.2f us per value' % (old * 1e6))
+    print('tagged                         %6.2f us per value' % (new * 1e6))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,12 +1,15 @@
 from contextlib import suppress
 
 from .file import File
+from .segment import SegmentFile
 from .dict import Dict
-from .buffer import Buffer
+from .buffer import Buffer, cascade
 from .encode import Encode
 from .pickle import Pickle
 from .python import Python
 from .compressed import *
+with suppress(ImportError):
+    from .sharedmemory import SharedMemory
 with suppress(ImportError):
     from .numpy import Numpy
 with suppress(ImportError):
@@ -1,61 +1,295 @@
 from .core import Interface
-from threading import Lock
+from .locks import RWLock
 from toolz import merge_with, topk, accumulate, pluck
 from operator import add
 from bisect import bisect
 from collections import defaultdict
 from queue import Queue, Empty
+from threading import Lock
+from .memory import AdaptiveMemory
+from .spill import Largest, spill_policy
+from .utils import nbytes
+from .writebehind import WriteBehind
 
 
 def zero():
     return 0
 
 class Buffer(Interface):
-    def __init__(self, fast, slow, available_memory=1e9):
-        self.lock = Lock()
+    """ Buffer appends in a fast partd, spilling keys to a slow one
+
+    Parameters
+    ----------
+    fast: Interface
+        Partd that receives all appends, usually a ``Dict``
+    slow: Interface
+        Partd to which we spill, usually a ``File``
+    available_memory: number, 'auto' or AdaptiveMemory
+        Spill once the fast partd holds more than this many bytes.  With
+        ``'auto'``, or an ``AdaptiveMemory``, this budget follows the memory
+        pressure of the process and its cgroup, see ``partd.memory``.
+    write_behind: int
+        Write spilled data to the slow partd on this many background threads
+        rather than making the appending caller wait.  Zero writes
+        synchronously.
+    max_inflight: int
+        With ``write_behind``, block appends while more than this many
+        spilled bytes wait to be written
+    policy: str or SpillPolicy
+        Which keys to spill: ``'largest'`` first, least recently used
+        (``'lru'``), oldest (``'fifo'``) or least often used (``'lfu'``).
+        See ``partd.spill``.
+    spill_fraction: float
+        Spill keys holding about this fraction of buffered bytes at a time
+    spill_maxcount: int
+        Spill at most this many keys at a time
+    stored_sizes: bool
+        Count the bytes that the fast partd reports storing, with
+        ``nbytes``, rather than the bytes appended.  Use this when the fast
+        partd compresses, as in ``ZLib(Dict())``.
+
+    The ``counters`` attribute counts keys read from memory alone
+    (``hits``), keys that needed the slow partd (``misses``) and spilled
+    keys and bytes.
+
+    The ``spilled`` set holds the keys that have data in the slow partd, so
+    that gets and deletes of other keys never touch it.  We can only start
+    it if the slow partd is empty, otherwise it is ``None`` and we always
+    ask the slow partd.  It assumes that nobody else writes to the slow
+    partd.
+    """
+    def __init__(self, fast, slow, available_memory=1e9, write_behind=0,
+                 max_inflight=2**28, policy='largest', spill_fraction=0.1,
+                 spill_maxcount=20, stored_sizes=False):
+        self.lock = RWLock()
         self.fast = fast
         self.slow = slow
+        if available_memory == 'auto':
+            available_memory = AdaptiveMemory()
         self.available_memory = available_memory
         self.lengths = defaultdict(zero)
         self.memory_usage = 0
+        self.write_behind = write_behind
+        self.max_inflight = max_inflight
+        self.policy = spill_policy(policy)
+        self.spill_fraction = spill_fraction
+        self.spill_maxcount = spill_maxcount
+        self.stored_sizes = stored_sizes
+        self.counters = {'hits': 0, 'misses': 0, 'spills': 0,
+                         'spilled_bytes': 0}
+        self._policy_lock = Lock()  # gets share self.lock
+        try:
+            self.spilled = set() if slow._empty() else None
+        except NotImplementedError:
+            self.spilled = None
+        self._start_writer()
         Interface.__init__(self)
 
+    @property
+    def _async_inline(self):
+        return self.fast._async_inline and self.slow._async_inline
+
+    @property
+    def _append_lists(self):
+        return self.fast._append_lists
+
+    def _start_writer(self):
+        if self.write_behind:
+            self._writer = WriteBehind(self.slow.append, self.write_behind,
+                                       self.max_inflight)
+        else:
+            self._writer = None
+
     def __getstate__(self):
+        self.sync()
         return {'fast': self.fast,
                 'slow': self.slow,
                 'memory_usage': self.memory_usage,
                 'lengths': self.lengths,
-                'available_memory': self.available_memory}
+                'available_memory': self.available_memory,
+                'write_behind': self.write_behind,
+                'max_inflight': self.max_inflight,
+                'policy': self.policy,
+                'spill_fraction': self.spill_fraction,
+                'spill_maxcount': self.spill_maxcount,
+                'stored_sizes': self.stored_sizes,
+                'counters': self.counters,
+                'spilled': self.spilled}
 
     def __setstate__(self, state):
         Interface.__setstate__(self, state)
-        self.lock = Lock()
+        self.lock = RWLock()
+        self.write_behind = 0
+        self.max_inflight = 2**28
+        self.spill_fraction = 0.1
+        self.spill_maxcount = 20
+        self.stored_sizes = False
+        self.counters = {'hits': 0, 'misses': 0, 'spills': 0,
+                         'spilled_bytes': 0}
+        self.spilled = None
         self.__dict__.update(state)
+        if 'policy' not in state:
+            self.policy = Largest()
+            for k, n in self.lengths.items():
+                self.policy.add(k, n)
+        self._policy_lock = Lock()
+        self._start_writer()
 
     def append(self, data, lock=True, **kwargs):
         if lock: self.lock.acquire()
         try:
-            for k, v in data.items():
-                self.lengths[k] += len(v)
-                self.memory_usage += len(v)
             self.fast.append(data, lock=False, **kwargs)
+            if self.stored_sizes:
+                keys = list(data)
+                sizes = self.fast.nbytes(keys, lock=False)
+            else:
+                keys = data.keys()
+                sizes = [self.lengths[k] + nbytes(v) for k, v in data.items()]
+            for k, n in zip(keys, sizes):
+                self.memory_usage += n - self.lengths[k]
+                self.lengths[k] = n
+                self.policy.add(k, n)
 
-            while self.memory_usage > self.available_memory:
-                keys = keys_to_flush(self.lengths, 0.1, maxcount=20)
+            budget = self.budget()
+            while self.memory_usage > budget:
+                keys = self._keys_to_flush(self.spill_fraction,
+                                           self.spill_maxcount)
                 self.flush(keys)
 
         finally:
             if lock: self.lock.release()
 
+    def budget(self):
+        """ Bytes that we may hold in the fast partd now """
+        if isinstance(self.available_memory, AdaptiveMemory):
+            return self.available_memory.update(self.memory_usage)
+        return self.available_memory
+
+    def _keys_to_flush(self, fraction=0.1, maxcount=100000):
+        """ Ask the policy for keys holding about fraction of our memory
+
+        As with ``keys_to_flush`` we spill at most half of our keys at once.
+        """
+        with self._policy_lock:
+            result = self.policy.victims(
+                self.memory_usage * fraction,
+                min(maxcount, max(len(self.lengths) // 2, 1)))
+        assert result
+        return result
+
     def _get(self, keys, lock=True, **kwargs):
+        if lock: self.lock.acquire(shared=True)
+        try:
+            if self._writer is not None:
+                self._writer.wait(keys)
+            fast = self.fast.get(keys, lock=False)
+            slow = self._slow(self.slow.get, keys)
+            with self._policy_lock:
+                self.policy.touch(keys)
+                for f, s in zip(fast, slow):
+                    if s:
+                        self.counters['misses'] += 1
+                    elif f:
+                        self.counters['hits'] += 1
+        finally:
+            if lock: self.lock.release()
+        return list(map(add, fast, slow))
+
+    def _slow(self, method, keys, default=b''):
+        """ Call a method of the slow partd only on keys that it holds """
+        if self.spilled is None:
+            return method(keys, lock=False)
+        some = [key for key in keys if key in self.spilled]
+        if not some:
+            return [default] * len(keys)
+        if len(some) == len(keys):
+            return method(keys, lock=False)
+        result = dict(zip(some, method(some, lock=False)))
+        return [result.get(key, default) for key in keys]
+
+    def iter_chunks(self, key, lock=True, **kwargs):
+        """ Iterate over the spilled pieces of key and then the buffered ones """
+        if lock: self.lock.acquire(shared=True)
+        try:
+            if self._writer is not None:
+                self._writer.wait([key])
+            fast = list(self.fast.iter_chunks(key, **kwargs))
+            if self.spilled is None or key in self.spilled:
+                slow = self.slow.iter_chunks(key, **kwargs)
+            else:
+                slow = iter(())
+            first = next(slow, None)  # pin down what is in slow already
+        finally:
+            if lock: self.lock.release()
+        if first is not None:
+            yield first
+            yield from slow
+        yield from fast
+
+    def _pop(self, keys, lock=True, **kwargs):
         if lock: self.lock.acquire()
         try:
-            result = list(map(add, self.fast.get(keys, lock=False),
-                                   self.slow.get(keys, lock=False)))
+            if self._writer is not None:
+                self._writer.wait(keys)
+            result = list(map(add, self.fast.pop(keys, lock=False),
+                                   self._slow(self.slow.pop, keys)))
+            self._forget(keys)
+            self._unspill(keys)
+        finally:
+            if lock: self.lock.release()
+        return result
+
+    def keys(self, lock=True):
+        """ Keys in either partd
+
+        Unless we track ``spilled`` keys, keys that went through a ``File``
+        come back as strings, so a key split across both partds may be
+        listed once in each form.
+        """
+        self.sync()
+        if lock: self.lock.acquire(shared=True)
+        try:
+            keys = self.fast.keys(lock=False)
+            if self.spilled is None:
+                keys += self.slow.keys(lock=False)
+            else:
+                keys += list(self.spilled)
+        finally:
+            if lock: self.lock.release()
+        return list(dict.fromkeys(keys))
+
+    def _nbytes(self, keys, lock=True, **kwargs):
+        if lock: self.lock.acquire(shared=True)
+        try:
+            if self._writer is not None:
+                self._writer.wait(keys)
+            result = list(map(add, self.fast.nbytes(keys, lock=False),
+                                   self._slow(self.slow.nbytes, keys, 0)))
         finally:
             if lock: self.lock.release()
         return result
 
+    def stats(self, lock=True):
+        self.sync()
+        if lock: self.lock.acquire(shared=True)
+        try:
+            fast = self.fast.stats(lock=False)
+            slow = self.slow.stats(lock=False)
+            keys = self.keys(lock=False)
+        finally:
+            if lock: self.lock.release()
+        result = {'nkeys': len(keys),
+                  'nbytes': fast['nbytes'] + slow['nbytes'],
+                  'memory_usage': self.memory_usage,
+                  'available_memory': self.budget(),
+                  'policy': self.policy.name,
+                  'counters': dict(self.counters),
+                  'fast': fast,
+                  'slow': slow}
+        if isinstance(self.available_memory, AdaptiveMemory):
+            result['adaptive'] = self.available_memory.stats()
+        return result
+
     def _iset(self, key, value, lock=True):
         """ Idempotent set """
         if lock: self.lock.acquire()
@@ -67,19 +301,40 @@ class Buffer(Interface):
     def _delete(self, keys, lock=True):
         if lock: self.lock.acquire()
         try:
+            if self._writer is not None:
+                self._writer.wait(keys)
             self.fast.delete(keys, lock=False)
-            self.slow.delete(keys, lock=False)
+            if self.spilled is None:
+                self.slow.delete(keys, lock=False)
+            else:
+                some = [key for key in keys if key in self.spilled]
+                if some:
+                    self.slow.delete(some, lock=False)
+            self._forget(keys)
+            self._unspill(keys)
         finally:
             if lock: self.lock.release()
 
     def drop(self):
+        self.sync()
         self._iset_seen.clear()
         self.fast.drop()
         self.slow.drop()
+        self._forget(list(self.lengths))
+        self.spilled = set()
 
     def __exit__(self, *args):
         self.drop()
 
+    def __del__(self):
+        if getattr(self, '_writer', None) is not None:
+            self._writer.close()
+
+    def sync(self):
+        """ Block until all spilled data has reached the slow partd """
+        if self._writer is not None:
+            self._writer.wait()
+
     def flush(self, keys=None, block=None):
         """ Flush keys to disk
 
@@ -89,19 +344,74 @@ class Buffer(Interface):
         keys: list or None
             list of keys to flush
         block: bool (defaults to None)
-            Whether or not to block until all writing is complete
+            Whether or not to block until all writing is complete.  Only
+            matters with ``write_behind``, otherwise we always block.
 
         If no keys are given then flush all keys
         """
         if keys is None:
             keys = list(self.lengths)
 
-        self.slow.append(dict(zip(keys, self.fast.get(keys))))
+        data = dict(zip(keys, self.fast.get(keys)))
+        if self._writer is None:
+            self.slow.append(data)
+        else:
+            self._writer.put(data)
+            if block:
+                self._writer.wait()
         self.fast.delete(keys)
 
-        for key in keys:
-            self.memory_usage -= self.lengths[key]
-            del self.lengths[key]
+        if self.spilled is not None:
+            self.spilled.update(keys)
+        self.counters['spills'] += len(keys)
+        self.counters['spilled_bytes'] += sum(self.lengths.get(k, 0)
+                                              for k in keys)
+        self._forget(keys)
+
+    def _unspill(self, keys):
+        if self.spilled is not None:
+            self.spilled.difference_update(keys)
+
+    def _forget(self, keys):
+        """ Stop accounting for keys that left the fast partd """
+        with self._policy_lock:
+            for key in keys:
+                self.memory_usage -= self.lengths.pop(key, 0)
+                self.policy.remove(key)
+
+
+def cascade(tiers, slow):
+    """ Chain Buffers through several fast partds down to a slow one
+
+    Each tier spills into the next one, and the last into ``slow``.  Tiers
+    count the bytes that they actually store, so a compressed tier holds
+    as much data as fits into its budget once compressed.
+
+    Parameters
+    ----------
+    tiers: list
+        ``(partd, available_memory)`` or ``(partd, available_memory,
+        options)`` tuples from fastest to slowest, where options is a dict of
+        further ``Buffer`` arguments, like ``policy``
+    slow: Interface
+        Partd that receives whatever spills from the last tier
+
+    Examples
+    --------
+    >>> from partd import Dict, File, ZLib
+    >>> p = cascade([(Dict(), 1e9), (ZLib(Dict()), 4e9)], File())
+    >>> p.append({'x': b'Hello'})
+    >>> p.get('x')
+    b'Hello'
+    """
+    for tier in reversed(tiers):
+        fast, available_memory = tier[:2]
+        options = dict(stored_sizes=True)
+        if len(tier) > 2:
+            options.update(tier[2])
+        slow = Buffer(fast, slow, available_memory=available_memory,
+                      **options)
+    return slow
 
 
 def keys_to_flush(lengths, fraction=0.1, maxcount=100000):
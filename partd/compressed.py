@@ -1,7 +1,10 @@
 from contextlib import suppress
 from functools import partial
+import threading
+from timeit import default_timer as time
 
 from .encode import Encode
+from .utils import nbytes
 
 __all__ = []
 
@@ -10,6 +13,16 @@ def bytes_concat(L):
     return b''.join(L)
 
 
+def identity(x):
+    return x
+
+
+# Algorithms that Adaptive may choose from, by name, as the tag byte that
+# marks their frames, compress(data, level) and decompress(data).  Tags are
+# stored on disk and so must never change.
+algorithms = {'none': (0, lambda data, level: data, identity)}
+
+
 with suppress(ImportError, AttributeError):
     # In case snappy is not installed, or another package called snappy that does not implement compress / decompress.
     # For example, SnapPy (https://pypi.org/project/snappy/)
@@ -28,6 +41,7 @@ with suppress(ImportError):
                    zlib.decompress,
                    bytes_concat)
     __all__.append('ZLib')
+    algorithms['zlib'] = (1, zlib.compress, zlib.decompress)
 
 
 with suppress(ImportError):
@@ -46,3 +60,359 @@ with suppress(ImportError):
                     blosc.decompress,
                     bytes_concat)
     __all__.append('Blosc')
+
+
+with suppress(ImportError):
+    import lz4.block
+
+    class LZ4(Encode):
+        """ Compress with LZ4, favouring speed
+
+        Parameters
+        ----------
+        partd: Interface or str, optional
+        level: int
+            0 for the fast mode, or 1 to 12 for the slower high compression
+            mode
+        nthreads: int
+            See ``Encode``
+        """
+        def __init__(self, partd=None, level=0, nthreads=1):
+            self.level = level
+            if level > 0:
+                compress = partial(lz4.block.compress, mode='high_compression',
+                                   compression=level)
+            else:
+                compress = lz4.block.compress
+            Encode.__init__(self, compress, lz4.block.decompress,
+                            bytes_concat, partd, nthreads=nthreads)
+
+    __all__.append('LZ4')
+
+    def lz4_compress(data, level=0):
+        if level > 0:
+            return lz4.block.compress(data, mode='high_compression',
+                                      compression=level)
+        return lz4.block.compress(data)
+
+    algorithms['lz4'] = (2, lz4_compress, lz4.block.decompress)
+
+
+with suppress(ImportError):
+    import zstandard
+
+    class Zstd(Encode):
+        """ Compress with Zstandard, optionally with a trained dictionary
+
+        Many small, similar values compress poorly one at a time.  With
+        ``dict_size`` we collect the first ``train_on`` values appended,
+        train a dictionary of that many bytes on them and compress all later
+        values with it.  The dictionary is stored in the underlying partd
+        under the key ``Zstd.dictionary_key``, so that other processes find
+        it there.  Values appended before we trained it stay readable
+        without it.  Train in one process only, as another process that
+        trained a dictionary of its own would overwrite this one.
+
+        Parameters
+        ----------
+        partd: Interface or str, optional
+        level: int
+            Compression level, from fast negative levels up to 22
+        dict_size: int
+            Bytes of dictionary to train, or 0 to not train one
+        train_on: int
+            Number of values to train the dictionary on
+        nthreads: int
+            See ``Encode``
+        """
+        dictionary_key = '.zstd-dictionary'
+
+        def __init__(self, partd=None, level=3, dict_size=0, train_on=1000,
+                     nthreads=1):
+            self.level = level
+            self.dict_size = dict_size
+            self.train_on = train_on
+            self.dictionary = None
+            self._samples = []
+            self._trained = False
+            Encode.__init__(self, self._compress, self._decompress,
+                            bytes_concat, partd, nthreads=nthreads)
+            self._lock = threading.Lock()
+            self._local = threading.local()
+            if dict_size:
+                self._load_dictionary()  # trained by an earlier Zstd
+
+        def __getstate__(self):
+            state = Encode.__getstate__(self)
+            for k in ['encode', 'decode', '_samples', '_lock', '_local']:
+                del state[k]
+            if self.dictionary is not None:
+                state['dictionary'] = self.dictionary.as_bytes()
+            return state
+
+        def __setstate__(self, state):
+            Encode.__setstate__(self, state)
+            self.encode = self._compress
+            self.decode = self._decompress
+            if self.dictionary is not None:
+                self.dictionary = zstandard.ZstdCompressionDict(
+                    self.dictionary)
+            self._samples = []
+            self._lock = threading.Lock()
+            self._local = threading.local()
+
+        def _codec(self, cls, dictionary):
+            """ Compressor or decompressor of this thread """
+            codecs = self._local.__dict__
+            key = cls, dictionary.dict_id() if dictionary is not None else 0
+            if key not in codecs:
+                if cls is zstandard.ZstdCompressor:
+                    codecs[key] = cls(level=self.level, dict_data=dictionary)
+                else:
+                    codecs[key] = cls(dict_data=dictionary)
+            return codecs[key]
+
+        def _compress(self, data):
+            return self._codec(zstandard.ZstdCompressor,
+                               self.dictionary).compress(data)
+
+        def _decompress(self, data):
+            dictionary = None
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            if dict_id:
+                dictionary = self.dictionary or self._load_dictionary()
+                if dictionary is None or dictionary.dict_id() != dict_id:
+                    raise ValueError("Data was compressed with a Zstd "
+                                     "dictionary that we do not have")
+            return self._codec(zstandard.ZstdDecompressor,
+                               dictionary).decompress(data)
+
+        def _load_dictionary(self):
+            with self._lock:
+                if self.dictionary is None:
+                    raw = self.partd.get(self.dictionary_key, lock=False)
+                    if raw:
+                        self.dictionary = zstandard.ZstdCompressionDict(
+                            bytes(raw))
+                        self._trained = True
+                return self.dictionary
+
+        def _train(self, values):
+            """ Collect samples and train a dictionary once we have enough """
+            with self._lock:
+                if self._trained:
+                    return
+                self._samples.extend(bytes(v) for v in values)
+                if len(self._samples) < self.train_on:
+                    return
+                samples, self._samples = self._samples, []
+                self._trained = True
+            if self._load_dictionary() is not None:  # trained elsewhere
+                return
+            try:
+                dictionary = zstandard.train_dictionary(
+                    self.dict_size, samples, level=self.level)
+            except zstandard.ZstdError:  # too little data to learn from
+                return
+            self.partd.iset(self.dictionary_key, dictionary.as_bytes())
+            self.dictionary = dictionary
+
+        def append(self, data, **kwargs):
+            if self.dict_size and not self._trained:
+                self._train(data.values())
+            Encode.append(self, data, **kwargs)
+
+        def keys(self, **kwargs):
+            return [k for k in Encode.keys(self, **kwargs)
+                    if k != self.dictionary_key]
+
+        def drop(self):
+            with self._lock:
+                self.dictionary = None
+                self._samples = []
+                self._trained = False
+            return Encode.drop(self)
+
+    __all__.append('Zstd')
+    algorithms['zstd'] = (3, zstandard.compress, zstandard.decompress)
+
+
+decompressors = {tag: decompress for tag, _, decompress in algorithms.values()}
+
+
+def adaptive_decode(frame):
+    """ Decompress a frame according to the tag byte in front of it """
+    frame = memoryview(frame)
+    try:
+        decompress = decompressors[frame[0]]
+    except KeyError:
+        names = {1: 'zlib', 2: 'lz4', 3: 'zstd'}
+        raise ValueError("Frame is compressed with %s, which is not "
+                         "installed" % names.get(frame[0], frame[0]))
+    return decompress(frame[1:])
+
+
+class Adaptive(Encode):
+    """ Choose no, fast or strong compression for each key
+
+    Frames start with a byte that names the algorithm that compressed them,
+    so that keys, and even frames of one key, may differ.  We compress the
+    first ``nsamples`` values of each key every way and keep whichever
+    result was cheapest.  The cost of a result is the time it took to
+    compress plus the time to write it at ``bandwidth`` bytes per second.
+    After that we settle on the cheapest way over those samples for the
+    key.  So already compressed payloads, like images or random floats, go
+    out as they are, while text gets compressed hard if that pays off.
+
+    ``report()`` shows the choice and compression ratio of each key.
+
+    Parameters
+    ----------
+    partd: Interface or str, optional
+    fast: tuple, optional
+        Name in ``algorithms`` and level of the fast codec.  Defaults to
+        ``('lz4', 0)``, or ``('zlib', 1)`` without lz4.
+    strong: tuple, optional
+        Name and level of the strong codec.  Defaults to ``('zstd', 3)``,
+        or ``('zlib', 6)`` without zstandard.
+    nsamples: int
+        Number of values of each key on which to compare codecs
+    bandwidth: float
+        Bytes per second at which we expect to write compressed data.  The
+        faster the storage, the less compression pays off.
+    nthreads: int
+        See ``Encode``
+    """
+    def __init__(self, partd=None, fast=None, strong=None, nsamples=3,
+                 bandwidth=2**26, nthreads=1):
+        if fast is None:
+            fast = ('lz4', 0) if 'lz4' in algorithms else ('zlib', 1)
+        if strong is None:
+            strong = ('zstd', 3) if 'zstd' in algorithms else ('zlib', 6)
+        for name, level in [fast, strong]:
+            if name not in algorithms:
+                raise ValueError("Unknown or not installed algorithm %r, "
+                                 "choose one of %s"
+                                 % (name, ', '.join(sorted(algorithms))))
+        self.codecs = {'none': ('none', None), 'fast': tuple(fast),
+                       'strong': tuple(strong)}
+        self.nsamples = nsamples
+        self.bandwidth = bandwidth
+        self.choices = dict()  # key -> 'none', 'fast' or 'strong'
+        self.sizes = dict()  # key -> [bytes given, bytes stored]
+        self._trials = dict()  # key -> (samples so far, {codec: cost})
+        self._lock = threading.Lock()
+        Encode.__init__(self, None, adaptive_decode, bytes_concat, partd,
+                        nthreads=nthreads)
+
+    def __getstate__(self):
+        state = Encode.__getstate__(self)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        Encode.__setstate__(self, state)
+        self._lock = threading.Lock()
+
+    def _compress(self, codec, value):
+        name, level = self.codecs[codec]
+        tag, compress, _ = algorithms[name]
+        return tag, compress(value, level)
+
+    def _sample(self, key, value):
+        """ Compress value every way, keep the cheapest and learn from it """
+        costs = {}
+        results = {}
+        for codec in self.codecs:
+            start = time()
+            results[codec] = self._compress(codec, value)
+            costs[codec] = (time() - start +
+                            nbytes(results[codec][1]) / self.bandwidth)
+        with self._lock:
+            n, total = self._trials.get(key, (0, dict.fromkeys(costs, 0)))
+            for codec, cost in costs.items():
+                total[codec] += cost
+            if n + 1 < self.nsamples:
+                self._trials[key] = (n + 1, total)
+            else:
+                self._trials.pop(key, None)
+                self.choices[key] = min(total, key=total.get)
+        return results[min(costs, key=costs.get)]
+
+    def _encode_item(self, item):
+        """ Tag byte and compressed bytes for a value of a key """
+        key, value = item
+        with self._lock:
+            codec = self.choices.get(key)
+        if codec is None:
+            tag, result = self._sample(key, value)
+        else:
+            tag, result = self._compress(codec, value)
+        with self._lock:
+            sizes = self.sizes.setdefault(key, [0, 0])
+            sizes[0] += nbytes(value)
+            sizes[1] += 1 + nbytes(result)
+        return [bytes([tag]), result]
+
+    def append(self, data, **kwargs):
+        framed = self._framer()
+        encoded = self._map(self._encode_item, data.items())
+        data = dict(zip(data, map(framed, encoded)))
+        self.partd.append(data, **kwargs)
+
+    def _iset(self, key, value, **kwargs):
+        encoded = self._encode_item((key, value))
+        return self.partd.iset(key, self._framer()(encoded), **kwargs)
+
+    def report(self, keys=None):
+        """ Codec chosen for each key and the ratio it achieved so far
+
+        The codec is ``None`` while we still compare codecs on a key.  The
+        ratio is of bytes given to bytes stored.
+        """
+        with self._lock:
+            keys = list(self.sizes) if keys is None else keys
+            return {key: {'codec': self.choices.get(key),
+                          'ratio': (self.sizes[key][0] /
+                                    max(self.sizes[key][1], 1)),
+                          'nbytes': self.sizes[key][0]}
+                    for key in keys if key in self.sizes}
+
+    def stats(self, **kwargs):
+        result = Encode.stats(self, **kwargs)
+        with self._lock:
+            counts = dict.fromkeys(self.codecs, 0)
+            for codec in self.choices.values():
+                counts[codec] += 1
+            given = sum(n for n, _ in self.sizes.values())
+            stored = sum(n for _, n in self.sizes.values())
+        result['codecs'] = counts
+        result['ratio'] = given / max(stored, 1)
+        return result
+
+    def _forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self.choices.pop(key, None)
+                self.sizes.pop(key, None)
+                self._trials.pop(key, None)
+
+    def _pop(self, keys, **kwargs):
+        result = Encode._pop(self, keys, **kwargs)
+        self._forget(keys)
+        return result
+
+    def delete(self, keys, **kwargs):
+        result = Encode.delete(self, keys, **kwargs)
+        self._forget(keys if isinstance(keys, list) else [keys])
+        return result
+
+    def drop(self):
+        with self._lock:
+            self.choices.clear()
+            self.sizes.clear()
+            self._trials.clear()
+        return Encode.drop(self)
+
+
+__all__.append('Adaptive')
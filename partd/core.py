@@ -1,9 +1,13 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
 import shutil
 import locket
 import string
+from threading import Lock
 from toolz import memoize
 from contextlib import contextmanager
+from functools import partial
 from .utils import nested_get, flatten
 
 
@@ -42,7 +46,28 @@ def token(key):
         return str(key)
 
 
+_async_executor = None
+_async_executor_lock = Lock()
+
+
+def async_executor():
+    """ Thread pool on which the async methods of partds run blocking calls """
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(
+                thread_name_prefix='partd-async')
+        return _async_executor
+
+
 class Interface:
+    # Whether async methods may call blocking methods directly on the event
+    # loop, because they never touch disk or network
+    _async_inline = False
+    # Whether append and iset take lists of bytes for values, as well as
+    # bytes, and store them joined
+    _append_lists = False
+
     def __init__(self):
         self._iset_seen = set()
 
@@ -76,15 +101,102 @@ class Interface:
         else:
             return self._get(keys, **kwargs)
 
+    def keys(self, lock=True):
+        """ List of keys that hold data """
+        raise NotImplementedError("%s can not list its keys"
+                                  % type(self).__name__)
+
+    def _empty(self, lock=True):
+        """ Whether we hold no keys, without listing them where we can """
+        return not self.keys(lock=lock)
+
+    def nbytes(self, keys, **kwargs):
+        """ Number of bytes stored under each key
+
+        Backends answer this from their own bookkeeping without reading
+        values.  By default we read them.
+        """
+        if not isinstance(keys, list):
+            return self.nbytes([keys], **kwargs)[0]
+        return self._nbytes(keys, **kwargs)
+
+    def _nbytes(self, keys, **kwargs):
+        return [len(v) for v in self._get(keys, **kwargs)]
+
+    def stats(self, lock=True):
+        """ Summary of stored data, for monitoring and scheduling """
+        keys = self.keys(lock=lock)
+        return {'nkeys': len(keys), 'nbytes': sum(self.nbytes(keys, lock=lock))}
+
+    def iter_chunks(self, key, **kwargs):
+        """ Iterate over the value of a single key in pieces
+
+        Backends that can yield stored pieces one at a time, so that memory
+        use is bounded by the largest piece rather than by the whole value.
+        By default we yield the whole value as a single piece.
+        """
+        yield self.get(key, **kwargs)
+
     def delete(self, keys, **kwargs):
         if not isinstance(keys, list):
-            return self._delete([keys], **kwargs)
+            keys = [keys]
+        result = self._delete(keys, **kwargs)
+        self._iset_seen.difference_update(keys)  # so that iset sets them again
+        return result
+
+    async def _run_async(self, func, *args, **kwargs):
+        if self._async_inline:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(async_executor(),
+                                          partial(func, *args, **kwargs))
+
+    async def aappend(self, data, **kwargs):
+        """ Awaitable version of ``append`` """
+        return await self._run_async(self.append, data, **kwargs)
+
+    async def aget(self, keys, **kwargs):
+        """ Awaitable version of ``get`` """
+        if not isinstance(keys, list):
+            return (await self.aget([keys], **kwargs))[0]
+        elif any(isinstance(key, list) for key in keys):  # nested case
+            flatkeys = list(flatten(keys))
+            result = await self.aget(flatkeys, **kwargs)
+            return nested_get(keys, dict(zip(flatkeys, result)))
         else:
-            return self._delete(keys, **kwargs)
+            return await self._aget(keys, **kwargs)
+
+    async def _aget(self, keys, **kwargs):
+        return await self._run_async(self._get, keys, **kwargs)
+
+    async def adelete(self, keys, **kwargs):
+        """ Awaitable version of ``delete`` """
+        return await self._run_async(self.delete, keys, **kwargs)
+
+    async def adrop(self):
+        """ Awaitable version of ``drop`` """
+        return await self._run_async(self.drop)
 
     def pop(self, keys, **kwargs):
-        with self.partd.lock:
-            result = self.partd.get(keys, lock=False)
-            self.partd.delete(keys, lock=False)
+        """ Get and delete keys as one atomic step
+
+        Suits data that is read exactly once, like the partitions of a
+        shuffle.  Backends free storage as they read where they can.
+        """
+        if not isinstance(keys, list):
+            return self.pop([keys], **kwargs)[0]
+        result = self._pop(keys, **kwargs)
+        self._iset_seen.difference_update(keys)
+        return result
+
+    def _pop(self, keys, lock=True, **kwargs):
+        if lock:
+            self.lock.acquire()
+        try:
+            result = self._get(keys, lock=False, **kwargs)
+            self.delete(keys, lock=False)
+        finally:
+            if lock:
+                self.lock.release()
         return result
 
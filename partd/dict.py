@@ -1,10 +1,25 @@
 from .core import Interface
-from threading import Lock
+from .locks import RWLock
+from .utils import join_buffers
 
 
 class Dict(Interface):
+    """ Store each key in a growable ``bytearray`` in memory
+
+    Appends extend the key's buffer in place, with amortized growth, so
+    memory use stays close to the size of the data however many small
+    appends we make, and gets need not join pieces.  Values may be bytes or
+    lists of bytes, which are copied straight into the buffer.
+
+    ``get(..., copy=False)`` returns read-only memoryviews rather than
+    copies.  They show the value as it was when we got it: while a view is
+    alive, appending to its key moves the key to a new buffer.
+    """
+    _async_inline = True
+    _append_lists = True
+
     def __init__(self):
-        self.lock = Lock()
+        self.lock = RWLock()
         self.data = dict()
         Interface.__init__(self)
 
@@ -14,35 +29,91 @@ class Dict(Interface):
     def __setstate__(self, state):
         Interface.__setstate__(self, state)
         Dict.__init__(self)
-        self.data = state['data']
+        # Older versions pickled lists of chunks
+        self.data = {k: bytearray(b''.join(v)) if isinstance(v, list) else v
+                     for k, v in state['data'].items()}
 
     def append(self, data, lock=True, **kwargs):
         if lock: self.lock.acquire()
         try:
             for k, v in data.items():
-                if k not in self.data:
-                    self.data[k] = []
-                self.data[k].append(v)
+                buf = self.data.get(k)
+                if buf is None:
+                    self.data[k] = buf = bytearray()
+                for b in (v if isinstance(v, (list, tuple)) else [v]):
+                    try:
+                        buf += b
+                    except BufferError:  # exported by get(copy=False)
+                        self.data[k] = buf = bytearray(buf)
+                        buf += b
         finally:
             if lock: self.lock.release()
 
-    def _get(self, keys, lock=True, **kwargs):
+    def _get(self, keys, lock=True, copy=True, **kwargs):
         assert isinstance(keys, (list, tuple, set))
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            if copy:
+                result = [bytes(self.data.get(key, b'')) for key in keys]
+            else:
+                result = [memoryview(self.data.get(key, b'')).toreadonly()
+                          for key in keys]
+        finally:
+            if lock:
+                self.lock.release()
+        return result
+
+    def iter_chunks(self, key, lock=True, **kwargs):
+        """ Yield the bytes of key as a single chunk """
+        result = self._get([key], lock=lock)[0]
+        if result:
+            yield result
+
+    def _pop(self, keys, lock=True, **kwargs):
         if lock:
             self.lock.acquire()
         try:
-            result = [b''.join(self.data.get(key, [])) for key in keys]
+            result = [bytes(self.data.pop(key, b'')) for key in keys]
         finally:
             if lock:
                 self.lock.release()
         return result
 
+    def keys(self, lock=True):
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            return list(self.data)
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _nbytes(self, keys, lock=True, **kwargs):
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            return [len(self.data.get(key, b'')) for key in keys]
+        finally:
+            if lock:
+                self.lock.release()
+
+    def stats(self, lock=True):
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            sizes = list(map(len, self.data.values()))
+        finally:
+            if lock:
+                self.lock.release()
+        return {'nkeys': len(sizes), 'nbytes': sum(sizes)}
+
     def _iset(self, key, value, lock=True):
         """ Idempotent set """
         if lock:
             self.lock.acquire()
         try:
-            self.data[key] = [value]
+            self.data[key] = bytearray(join_buffers(value))
         finally:
             if lock:
                 self.lock.release()
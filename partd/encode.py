@@ -1,39 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from toolz import concat
+
 from .core import Interface
 from .file import File
-from toolz import valmap
-from .utils import frame, framesplit
+from .utils import frame, framesplit, framev, iterframes
 
 
 class Encode(Interface):
-    def __init__(self, encode, decode, join, partd=None):
+    """ Encode values on their way into a partd and decode them on the way out
+
+    Parameters
+    ----------
+    encode: callable
+        Function from a value to bytes
+    decode: callable
+        Function from bytes to a value
+    join: callable
+        Function from a list of decoded values to one value
+    partd: Interface or str, optional
+        Where to store the encoded bytes.  Defaults to a new ``File``.
+    nthreads: int
+        Encode the values of one append, and decode the frames of one get,
+        concurrently with this many threads.  Results keep their order.
+        Pays off with codecs that release the GIL, like zlib, bz2, blosc
+        and snappy, when we move many keys at once.
+    """
+    def __init__(self, encode, decode, join, partd=None, nthreads=1):
         if not partd or isinstance(partd, str):
             partd = File(partd)
         self.partd = partd
         self.encode = encode
         self.decode = decode
         self.join = join
+        self.nthreads = nthreads
+        self._executor = None
         Interface.__init__(self)
 
     def __getstate__(self):
-        return self.__dict__
+        state = self.__dict__.copy()
+        del state['_executor']
+        return state
 
-    __setstate__ = Interface.__setstate__
+    def __setstate__(self, state):
+        state.setdefault('nthreads', 1)
+        Interface.__setstate__(self, state)
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.nthreads)
+        return self._executor
+
+    def _map(self, func, seq):
+        """ Apply func to every element, in order, on our threads """
+        seq = list(seq)
+        if self.nthreads <= 1 or len(seq) <= 1:
+            return list(map(func, seq))
+        # A few batches per thread to even out values of different sizes
+        n = -(-len(seq) // (4 * self.nthreads))
+        batches = [seq[i:i + n] for i in range(0, len(seq), n)]
+        results = self.executor.map(lambda batch: list(map(func, batch)),
+                                    batches)
+        return list(concat(results))
 
     def append(self, data, **kwargs):
-        data = valmap(self.encode, data)
-        data = valmap(frame, data)
+        """ Encode values and append them, each as a frame
+
+        Frames go down as ``[header, payload]`` lists so that the payload is
+        not copied on its way to the underlying partd.
+        """
+        framed = self._framer()
+        encoded = self._map(self.encode, data.values())
+        data = dict(zip(data, map(framed, encoded)))
         self.partd.append(data, **kwargs)
 
+    def _framer(self):
+        return framev if self.partd._append_lists else frame
+
     def _get(self, keys, **kwargs):
         raw = self.partd._get(keys, **kwargs)
-        return [self.join([self.decode(frame) for frame in framesplit(chunk)])
-                for chunk in raw]
+        return self._unframe_all(raw)
+
+    def _pop(self, keys, **kwargs):
+        raw = self.partd.pop(keys, **kwargs)
+        return self._unframe_all(raw)
+
+    def _unframe(self, chunk):
+        return self.join([self.decode(frame) for frame in framesplit(chunk)])
+
+    def _unframe_all(self, chunks):
+        """ Decoded values of many chunks, decoding all frames together """
+        if self.nthreads <= 1:
+            return list(map(self._unframe, chunks))
+        frames = [list(framesplit(chunk)) for chunk in chunks]
+        decoded = iter(self._map(self.decode, concat(frames)))
+        return [self.join([next(decoded) for _ in fs]) for fs in frames]
+
+    def iter_chunks(self, key, **kwargs):
+        """ Iterate over decoded values of key, one per append """
+        for f in iterframes(self.partd.iter_chunks(key, **kwargs)):
+            yield self.decode(f)
 
     def delete(self, keys, **kwargs):
-        return self.partd.delete(keys, **kwargs)
+        result = self.partd.delete(keys, **kwargs)
+        self._iset_seen.difference_update(keys if isinstance(keys, list)
+                                          else [keys])
+        return result
+
+    def keys(self, **kwargs):
+        return self.partd.keys(**kwargs)
+
+    def _empty(self, **kwargs):
+        return self.partd._empty(**kwargs)
+
+    def _nbytes(self, keys, **kwargs):
+        """ Encoded, framed sizes as stored in the underlying partd """
+        return self.partd.nbytes(keys, **kwargs)
+
+    def stats(self, **kwargs):
+        return self.partd.stats(**kwargs)
 
     def _iset(self, key, value, **kwargs):
-        return self.partd.iset(key, frame(self.encode(value)), **kwargs)
+        return self.partd.iset(key, self._framer()(self.encode(value)), **kwargs)
 
     def drop(self):
         return self.partd.drop()
@@ -45,3 +135,7 @@ class Encode(Interface):
     def __exit__(self, *args):
         self.drop()
         self.partd.__exit__(*args)
+
+    def __del__(self):
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
@@ -1,16 +1,73 @@
 import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
+from functools import partial
+import mmap
 import os
 import shutil
 import string
 import tempfile
+from threading import Lock
+import weakref
+import zlib
 
 from .core import Interface
-import locket
+from .locks import StripedLock, file_lock
+from .utils import writev
+from .writebehind import WriteBehind
+from toolz import concat
+
+# With max_open_files, remember the filenames of up to this many keys
+max_filenames = 2**16
+
+# Prefix of temporary files that iset writes before moving them into place
+iset_prefix = '.iset-'
 
 
 class File(Interface):
-    def __init__(self, path=None, dir=None):
+    """ Store each key in its own file within a directory
+
+    Parameters
+    ----------
+    path: str, optional
+        Directory in which to store files.  Defaults to a temporary one.
+    dir: str, optional
+        Parent directory of the temporary directory
+    max_open_files: int
+        Keep up to this many files open between calls, least recently used
+        first out, and remember which directories and filenames we have
+        already seen.  Repeated appends to the same keys then cost a single
+        write each.  Only enable this if no other process deletes or drops
+        keys in this directory.
+    nthreads: int
+        Read the files of many keys concurrently with this many threads.
+        Helps on storage where reads are bound by latency, like NVMe drives
+        or network file systems.
+    fanout: int
+        Spread files over this many levels of 256 subdirectories, chosen by
+        a hash of the filename, so that no single directory holds millions
+        of entries.  At most 4.  The subdirectories themselves make
+        ``drop`` slower, so this pays off only with very many keys.
+    nlocks: int
+        Guard keys with this many lock files, one per hash bucket of keys,
+        rather than with one lock for the whole directory.  Processes that
+        touch disjoint keys then rarely wait on each other.  ``self.lock``
+        takes every stripe and so still excludes everyone.
+    write_behind: int
+        Hand appends to this many background threads and return
+        immediately.  Gets, deletes and isets wait for queued appends to
+        their keys.  Call ``sync`` before holding ``self.lock`` yourself.
+    max_inflight: int
+        With ``write_behind``, block appends while more than this many
+        bytes wait to be written
+    """
+    _append_lists = True
+
+    def __init__(self, path=None, dir=None, max_open_files=0, nthreads=1,
+                 fanout=0, nlocks=0, write_behind=0, max_inflight=2**28):
+        if not 0 <= fanout <= 4:
+            raise ValueError("fanout must be between 0 and 4, got %d" % fanout)
         if not path:
             path = tempfile.mkdtemp(suffix='.partd', dir=dir)
             cleanup_files.append(path)
@@ -21,94 +78,470 @@ class File(Interface):
         if not os.path.exists(path):
             with suppress(OSError):
                 os.makedirs(path)
-        self.lock = locket.lock_file(self.filename('.lock'))
+        self.max_open_files = max_open_files
+        self._handles = OrderedDict()
+        self._handles_lock = Lock()  # threads may write under shared stripes
+        self._filenames = dict()
+        self._dirs = set()
+        self.nthreads = nthreads
+        self._executor = None
+        self.fanout = fanout
+        self.nlocks = nlocks
+        if nlocks:
+            self.lock = StripedLock(
+                file_lock(os.path.join(path, '.lock-%d' % i))
+                for i in range(nlocks))
+        else:
+            self.lock = file_lock(os.path.join(path, '.lock'))
+        self.write_behind = write_behind
+        self.max_inflight = max_inflight
+        if write_behind:
+            # Weak, so that writer threads do not keep us alive
+            append = weakref.WeakMethod(self._append)
+            self._writer = WriteBehind(lambda data: append()(data),
+                                       write_behind, max_inflight)
+        else:
+            self._writer = None
         Interface.__init__(self)
 
     def __getstate__(self):
-        return {'path': self.path}
+        self.sync()
+        return {'path': self.path, 'max_open_files': self.max_open_files,
+                'nthreads': self.nthreads, 'fanout': self.fanout,
+                'nlocks': self.nlocks, 'write_behind': self.write_behind,
+                'max_inflight': self.max_inflight}
 
     def __setstate__(self, state):
         Interface.__setstate__(self, state)
-        File.__init__(self, state['path'])
+        File.__init__(self, state['path'],
+                      max_open_files=state.get('max_open_files', 0),
+                      nthreads=state.get('nthreads', 1),
+                      fanout=state.get('fanout', 0),
+                      nlocks=state.get('nlocks', 0),
+                      write_behind=state.get('write_behind', 0),
+                      max_inflight=state.get('max_inflight', 2**28))
+
+    def _acquire(self, keys, shared=False):
+        """ Acquire the lock, or just the stripes guarding keys """
+        if self.nlocks:
+            n = len(os.path.join(self.path, ''))
+            self.lock.acquire([self.filename(key)[n:] for key in keys],
+                              shared=shared)
+        else:
+            self.lock.acquire(shared=shared)
+
+    def _release(self, keys):
+        if self.nlocks:
+            n = len(os.path.join(self.path, ''))
+            self.lock.release([self.filename(key)[n:] for key in keys])
+        else:
+            self.lock.release()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.nthreads)
+        return self._executor
+
+    def _makedirs(self, fn):
+        dirname = os.path.dirname(fn)
+        if dirname in self._dirs:
+            return
+        if not os.path.exists(dirname):
+            with suppress(FileExistsError):
+                os.makedirs(dirname)
+        if self.max_open_files:
+            self._dirs.add(dirname)
+
+    def _handle(self, fn):
+        """ Cached handle open for appending
+
+        Hold ``_handles_lock`` while using it, as another thread may close
+        it to make room for its own.
+        """
+        try:
+            f = self._handles[fn]
+            self._handles.move_to_end(fn)
+            return f
+        except KeyError:
+            pass
+        self._makedirs(fn)
+        f = open(fn, 'ab')
+        if len(self._handles) >= self.max_open_files:
+            _, old = self._handles.popitem(last=False)
+            old.close()
+        self._handles[fn] = f
+        return f
+
+    def _close(self, fn=None):
+        """ Close cached handle for one filename, or all of them """
+        with self._handles_lock:
+            if fn is None:
+                while self._handles:
+                    self._handles.popitem()[1].close()
+            elif fn in self._handles:
+                self._handles.pop(fn).close()
 
     def append(self, data, lock=True, fsync=False, **kwargs):
-        if lock: self.lock.acquire()
+        """ Append bytes onto the files of many keys
+
+        Values may be bytes or lists of bytes.  Lists are written with one
+        vectored write.
+
+        With ``fsync=True`` every file is flushed to stable storage before
+        returning.  All writes happen first and all fsyncs afterwards,
+        outside of the lock, so that the file system can commit fsyncs of
+        concurrent appends together.  With ``nthreads > 1`` the fsyncs of
+        one call are also issued concurrently.
+
+        With ``write_behind`` appends are queued rather than written, unless
+        we ask for ``fsync``, or pass ``lock=False`` because we hold the
+        lock ourselves and the writer threads could not take it.
+        """
+        if self._writer is None:
+            return self._append(data, lock=lock, fsync=fsync)
+        if fsync or not lock:
+            self._writer.wait(data)
+            return self._append(data, lock=lock, fsync=fsync)
+        self._writer.put(data)
+
+    def sync(self):
+        """ Block until all queued appends are written """
+        if self._writer is not None:
+            self._writer.wait()
+
+    def _append(self, data, lock=True, fsync=False):
+        fds = []
+        if lock: self._acquire(data)
         try:
             for k, v in data.items():
                 fn = self.filename(k)
-                if not os.path.exists(os.path.dirname(fn)):
-                    os.makedirs(os.path.dirname(fn))
+                if self.max_open_files:
+                    with self._handles_lock:
+                        f = self._handle(fn)
+                        writev(f, v)
+                        f.flush()
+                        if fsync:
+                            fds.append(os.dup(f.fileno()))
+                    continue
+                self._makedirs(fn)
                 with open(fn, 'ab') as f:
-                    f.write(v)
+                    writev(f, v)
+                    f.flush()
                     if fsync:
-                        os.fsync(f)
+                        fds.append(os.dup(f.fileno()))
+        except BaseException:
+            for fd in fds:
+                os.close(fd)
+            raise
         finally:
-            if lock: self.lock.release()
+            if lock: self._release(data)
+        if fsync:
+            self._fsync(fds, set(os.path.dirname(self.filename(k))
+                                 for k in data))
+
+    def _fsync(self, fds, dirs=()):
+        """ Flush and close file descriptors, then flush directories """
+        def sync(fd):
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if self.nthreads > 1 and len(fds) > 1:
+            list(self.executor.map(sync, fds))
+        else:
+            for fd in fds:
+                sync(fd)
+        if os.name != 'nt':  # directories can not be opened on Windows
+            for dirname in dirs:
+                sync(os.open(dirname, os.O_RDONLY))
+
+    def _get(self, keys, lock=True, memory_map=False, **kwargs):
+        """ Get bytes of many keys
 
-    def _get(self, keys, lock=True, **kwargs):
+        With ``memory_map=True`` return read-only memoryviews onto memory
+        mapped files rather than bytes.  These share pages with the
+        operating system's page cache and so cost no heap memory.  Views
+        keep showing the old bytes if their keys are later overwritten with
+        ``iset``, deleted or popped, which replace or unlink files.  But if
+        anything truncates a mapped file, as another program might, then
+        touching the view kills the process with ``SIGBUS``.
+        """
         assert isinstance(keys, (list, tuple, set))
+        if self._writer is not None:
+            self._writer.wait(keys)
         if lock:
-            self.lock.acquire()
+            self._acquire(keys, shared=True)
+        try:
+            filenames = [self.filename(key) for key in keys]
+            if self.nthreads > 1 and len(filenames) > 1:
+                # One batch per thread
+                n = -(-len(filenames) // self.nthreads)
+                batches = [filenames[i:i + n]
+                           for i in range(0, len(filenames), n)]
+                read = partial(self._read, memory_map=memory_map)
+                result = list(concat(self.executor.map(
+                    lambda batch: list(map(read, batch)), batches)))
+            else:
+                result = [self._read(fn, memory_map) for fn in filenames]
+        finally:
+            if lock:
+                self._release(keys)
+        return result
+
+    def _read(self, fn, memory_map=False):
+        # Not through cached handles, whose file positions would be shared
+        # by all threads that get under the shared lock
+        try:
+            with open(fn, 'rb') as f:
+                if memory_map:
+                    return map_file(f)
+                return f.read()
+        except OSError:
+            return b''
+
+    def iter_chunks(self, key, lock=True, blocksize=2**24, **kwargs):
+        """ Iterate over the bytes of key in blocks of blocksize
+
+        We see the file as it was when iteration started.
+        """
+        if self._writer is not None:
+            self._writer.wait([key])
+        if lock:
+            self._acquire([key], shared=True)
+        try:
+            try:
+                f = open(self.filename(key), 'rb')
+            except OSError:
+                return
+            size = os.fstat(f.fileno()).st_size
+        finally:
+            if lock:
+                self._release([key])
+        with f:
+            while size > 0:
+                block = f.read(min(blocksize, size))
+                if not block:
+                    break
+                size -= len(block)
+                yield block
+
+    def _pop(self, keys, lock=True, **kwargs):
+        """ Get and delete keys
+
+        We unlink rather than truncate files, so that memory mapped views
+        of them stay valid.  So we do not free disk space as we read: each
+        key briefly takes up both disk and memory in full.
+        """
+        if self._writer is not None:
+            self._writer.wait(keys)
+        if lock:
+            self._acquire(keys)
         try:
             result = []
             for key in keys:
+                fn = self.filename(key)
+                self._close(fn)
                 try:
-                    with open(self.filename(key), 'rb') as f:
+                    with open(fn, 'rb') as f:
                         result.append(f.read())
                 except OSError:
                     result.append(b'')
+                    continue
+                os.remove(fn)
         finally:
             if lock:
-                self.lock.release()
+                self._release(keys)
         return result
 
     def _iset(self, key, value, lock=True):
         """ Idempotent set """
         fn = self.filename(key)
-        if not os.path.exists(os.path.dirname(fn)):
-            os.makedirs(os.path.dirname(fn))
+        self._makedirs(fn)
+        if self._writer is not None:
+            self._writer.wait([key])
         if lock:
-            self.lock.acquire()
+            self._acquire([key])
         try:
-            with open(self.filename(key), 'wb') as f:
-                f.write(value)
+            self._close(fn)
+            # Replace rather than truncate the file, which would pull the
+            # pages out from under memory mapped views of it
+            handle, tmp = tempfile.mkstemp(prefix=iset_prefix,
+                                           dir=os.path.dirname(fn))
+            try:
+                with open(handle, 'wb') as f:
+                    writev(f, value)
+                os.replace(tmp, fn)
+            except BaseException:
+                with suppress(OSError):
+                    os.remove(tmp)
+                raise
         finally:
             if lock:
-                self.lock.release()
+                self._release([key])
 
     def _delete(self, keys, lock=True):
+        if self._writer is not None:
+            self._writer.wait(keys)
         if lock:
-            self.lock.acquire()
+            self._acquire(keys)
         try:
             for key in keys:
-                path = filename(self.path, key)
+                path = self.filename(key)
+                self._close(path)
                 if os.path.exists(path):
                     os.remove(path)
+        finally:
+            if lock:
+                self._release(keys)
+
+    def _walk(self):
+        """ Keys and filenames of everything stored in the directory """
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            rel = os.path.relpath(dirpath, self.path)
+            parts = [] if rel == os.curdir else rel.split(os.sep)
+            if len(parts) < self.fanout:
+                continue
+            parts = parts[self.fanout:]  # drop hash buckets
+            for fn in filenames:
+                if not parts and fn.startswith('.lock'):
+                    continue
+                if fn.startswith(iset_prefix):
+                    continue
+                key = tuple(parts + [fn]) if parts else fn
+                yield key, os.path.join(dirpath, fn)
+
+    def keys(self, lock=True):
+        """ Keys as recovered from filenames
+
+        Filenames do not record the types of keys, so we get back strings,
+        or tuples of strings for tuple keys.
+        """
+        self.sync()
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            return [key for key, fn in self._walk()]
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _empty(self, lock=True):
+        self.sync()
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            return next(self._walk(), None) is None
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _nbytes(self, keys, lock=True, **kwargs):
+        if self._writer is not None:
+            self._writer.wait(keys)
+        if lock:
+            self._acquire(keys, shared=True)
+        try:
+            return [_size(self.filename(key)) for key in keys]
+        finally:
+            if lock:
+                self._release(keys)
+
+    def stats(self, lock=True):
+        self.sync()
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            sizes = [_size(fn) for key, fn in self._walk()]
         finally:
             if lock:
                 self.lock.release()
+        return {'nkeys': len(sizes), 'nbytes': sum(sizes)}
 
     def drop(self):
-        if os.path.exists(self.path):
-            shutil.rmtree(self.path)
+        self.sync()
+        self._close()
+        self._dirs.clear()
+        self._filenames.clear()
+        if self.nlocks and os.path.exists(self.path):
+            # Keep the lock files that other processes may be waiting on
+            with self.lock:
+                for fn in os.listdir(self.path):
+                    if fn.startswith('.lock-'):
+                        continue
+                    fn = os.path.join(self.path, fn)
+                    if os.path.isdir(fn):
+                        shutil.rmtree(fn)
+                    else:
+                        os.remove(fn)
+        else:
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path)
+            os.mkdir(self.path)
         self._iset_seen.clear()
-        os.mkdir(self.path)
 
     def filename(self, key):
-        return filename(self.path, key)
+        if not self.max_open_files:
+            return filename(self.path, key, self.fanout)
+        try:
+            return self._filenames[key]
+        except KeyError:
+            pass
+        if len(self._filenames) >= max_filenames:
+            self._filenames.clear()
+        fn = self._filenames[key] = filename(self.path, key, self.fanout)
+        return fn
 
     def __exit__(self, *args):
         self.drop()
-        os.rmdir(self.path)
+        shutil.rmtree(self.path)
 
     def __del__(self):
+        if not hasattr(self, 'lock'):  # failed in __init__
+            return
+        if self._writer is not None:
+            self._writer.close()
+        self._close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
         if not self._explicitly_given_path:
             self.drop()
-            os.rmdir(self.path)
+            shutil.rmtree(self.path)
+
+
+def _size(fn):
+    try:
+        return os.stat(fn).st_size
+    except OSError:
+        return 0
+
 
+def map_file(f):
+    """ Read-only memoryview of a memory mapped file """
+    size = os.fstat(f.fileno()).st_size
+    if not size:  # can not map empty files
+        return b''
+    return memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
 
-def filename(path, key):
-    return os.path.join(path, escape_filename(token(key)))
+
+def filename(path, key, fanout=0):
+    """ Filename of key within directory
+
+    With ``fanout`` levels the file lives under that many subdirectories
+    named by successive bytes of a CRC32 hash of its escaped name.  This is
+    stable across processes and platforms.
+
+    >>> filename('dir', 'x')  # doctest: +SKIP
+    'dir/x'
+    >>> filename('dir', 'x', fanout=2)  # doctest: +SKIP
+    'dir/83/16/x'
+    """
+    fn = escape_filename(token(key))
+    if fanout:
+        h = zlib.crc32(fn.encode('utf-8', 'surrogatepass'))
+        buckets = ['%02x' % ((h >> (8 * i)) & 0xff) for i in range(fanout)]
+        fn = os.path.join(*buckets, fn)
+    return os.path.join(path, fn)
 
 
 # http://stackoverflow.com/questions/295135/turn-a-string-into-a-valid-filename-in-python
@@ -0,0 +1,185 @@
+""" Locks to coordinate access to partds between threads and processes
+
+Our locks can be held either shared, by many readers at once, or exclusive,
+by one writer.  ``acquire()`` without arguments and ``with lock:`` take the
+lock exclusively, so they also stand in for a plain ``threading.Lock``.
+"""
+from threading import Condition, Lock
+import zlib
+
+import locket
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class RWLock:
+    """ Shared/exclusive lock between the threads of one process
+
+    Waiting writers block new readers, so a stream of readers can not starve
+    writers.
+
+    >>> lock = RWLock()
+    >>> lock.acquire(shared=True)
+    >>> lock.acquire(shared=True)
+    >>> lock.release()
+    >>> lock.release()
+    >>> with lock:
+    ...     pass
+    """
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire(self, shared=False):
+        with self._cond:
+            if shared:
+                while self._writer or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+            else:
+                self._waiting_writers += 1
+                try:
+                    while self._writer or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = True
+
+    def release(self):
+        with self._cond:
+            if self._writer:
+                self._writer = False
+            else:
+                self._readers -= 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class FileLock:
+    """ Shared/exclusive lock on a file between threads and processes
+
+    Every acquisition opens its own file description and locks it with
+    ``flock``, so the threads of one process exclude each other just as
+    separate processes do.  Exclusive holders interoperate with ``locket``
+    locks on the same file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._files = []
+        self._lock = Lock()
+
+    def acquire(self, shared=False):
+        f = open(self.path, 'ab')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        except BaseException:
+            f.close()
+            raise
+        with self._lock:
+            self._files.append(f)
+
+    def release(self):
+        # All current holders share one mode, so any of their files will do
+        with self._lock:
+            f = self._files.pop()
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class ExclusiveLock:
+    """ Wrap a lock without a shared mode, taking it exclusively either way """
+    def __init__(self, lock):
+        self.lock = lock
+
+    def acquire(self, shared=False):
+        self.lock.acquire()
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def file_lock(path):
+    """ Shared/exclusive lock on path, always exclusive without fcntl """
+    if fcntl is None:
+        return ExclusiveLock(locket.lock_file(path))
+    return FileLock(path)
+
+
+class StripedLock:
+    """ Many locks, each guarding a hash bucket of keys
+
+    Operations on disjoint keys can proceed in parallel if their keys hash
+    onto different stripes.  Acquiring without names takes every stripe,
+    which excludes everyone, so the object works as a drop-in replacement for
+    a single lock with ``acquire``, ``release`` and ``with``.
+
+    Stripes are always acquired in ascending order, so holders of several
+    stripes can not deadlock each other.
+
+    >>> lock = StripedLock([RWLock() for i in range(4)])
+    >>> lock.acquire(['x', 'y'])
+    >>> lock.release(['x', 'y'])
+    >>> lock.acquire(['x'], shared=True)
+    >>> lock.release(['x'])
+    >>> with lock:
+    ...     pass
+    """
+    def __init__(self, locks):
+        self.locks = list(locks)
+
+    def stripe(self, name):
+        """ Index of the stripe guarding name """
+        return zlib.crc32(name.encode('utf-8', 'surrogatepass')) % len(self.locks)
+
+    def stripes(self, names=None):
+        """ Locks guarding names, in acquisition order """
+        if names is None:
+            return self.locks
+        return [self.locks[i] for i in sorted(set(map(self.stripe, names)))]
+
+    def acquire(self, names=None, shared=False):
+        acquired = []
+        try:
+            for lock in self.stripes(names):
+                lock.acquire(shared=shared)
+                acquired.append(lock)
+        except BaseException:
+            for lock in reversed(acquired):
+                lock.release()
+            raise
+
+    def release(self, names=None):
+        for lock in reversed(self.stripes(names)):
+            lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -0,0 +1,182 @@
+""" Measure memory pressure, to size Buffers adaptively
+
+We read the resident set size of the process from ``/proc/self/statm`` and
+the usage and limit of its cgroup from the cgroup v2 files ``memory.current``,
+``memory.stat`` and ``memory.max``.  Every function returns ``None`` where
+this information is not available, as on other platforms.
+"""
+import os
+from time import monotonic
+
+
+def process_rss(statm='/proc/self/statm'):
+    """ Resident set size of this process in bytes """
+    try:
+        with open(statm) as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def cgroup_dir(root='/sys/fs/cgroup', cgroup='/proc/self/cgroup'):
+    """ Directory of the cgroup v2 of this process """
+    try:
+        with open(cgroup) as f:
+            for line in f:
+                if line.startswith('0::'):
+                    path = os.path.join(root, line[3:].strip().lstrip('/'))
+                    if os.path.exists(os.path.join(path, 'memory.current')):
+                        return path
+    except OSError:
+        pass
+    if os.path.exists(os.path.join(root, 'memory.current')):
+        return root  # within a container we see our cgroup as the root
+    return None
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            text = f.read().strip()
+    except OSError:
+        return None
+    if text == 'max':
+        return None
+    return int(text)
+
+
+def cgroup_memory(path=None):
+    """ Working set and limit of a cgroup in bytes
+
+    Like the kubelet we count the working set as ``memory.current`` less
+    inactive file pages, which the kernel can drop rather than kill us.
+    """
+    path = path or cgroup_dir()
+    if path is None:
+        return None, None
+    current = _read_int(os.path.join(path, 'memory.current'))
+    limit = _read_int(os.path.join(path, 'memory.max'))
+    if current is not None:
+        try:
+            with open(os.path.join(path, 'memory.stat')) as f:
+                for line in f:
+                    name, value = line.split()
+                    if name == 'inactive_file':
+                        current = max(current - int(value), 0)
+                        break
+        except (OSError, ValueError):
+            pass
+    return current, limit
+
+
+def physical_memory():
+    """ Total physical memory of the machine in bytes """
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class AdaptiveMemory:
+    """ Spill threshold of a Buffer that follows memory pressure
+
+    Pass this as the ``available_memory`` of a ``Buffer``.  At most every
+    ``interval`` seconds we measure how much memory is in use, the larger of
+    the resident set size of the process and the working set of its cgroup.
+    Above ``high * limit`` we shrink the budget of the Buffer by the excess,
+    so that it spills.  Below ``low * limit`` we grow it by the slack.  In
+    between we leave it alone, so that it does not flap.  The first
+    measurement sets the budget to what the Buffer holds plus the room left
+    below ``high * limit``, so that a busy process does not start out
+    spilling everything.  Where we can not measure memory use, as on
+    platforms without ``/proc``, the budget is ``low * limit``.
+
+    Parameters
+    ----------
+    limit: int, optional
+        Bytes that we may use.  Defaults to the limit of our cgroup, or else
+        to the physical memory of the machine.
+    high: float
+        Shrink the budget above this fraction of the limit
+    low: float
+        Grow the budget below this fraction of the limit
+    minimum: int
+        Never shrink the budget below this many bytes
+    maximum: int, optional
+        Never grow the budget above this many bytes.  Defaults to
+        ``high * limit``.
+    interval: float
+        Seconds between measurements
+    cgroup: str, optional
+        Directory of the cgroup to watch.  Defaults to our own.
+
+    Examples
+    --------
+    >>> m = AdaptiveMemory(limit=2**30)
+    >>> m.update(0) > 0  # doctest: +SKIP
+    True
+    """
+    def __init__(self, limit=None, high=0.8, low=0.6, minimum=2**20,
+                 maximum=None, interval=1.0, cgroup=None):
+        if not 0 < low <= high <= 1:
+            raise ValueError("Need 0 < low <= high <= 1, got %s and %s"
+                             % (low, high))
+        self.cgroup = cgroup or cgroup_dir()
+        if limit is None and self.cgroup is not None:
+            limit = cgroup_memory(self.cgroup)[1]
+        if limit is None:
+            limit = physical_memory()
+        if limit is None:
+            raise ValueError("Can not find out how much memory we may use, "
+                             "pass a limit")
+        self.limit = limit
+        self.high = high
+        self.low = low
+        self.minimum = minimum
+        self.maximum = high * limit if maximum is None else maximum
+        self.interval = interval
+        self.budget = minimum
+        self.used = None
+        self._last = None
+        self._measured = False
+
+    def measure(self):
+        """ Bytes of memory in use, or None if we can not tell """
+        rss = process_rss()
+        working_set = None
+        if self.cgroup is not None:
+            working_set = cgroup_memory(self.cgroup)[0]
+        if rss is None and working_set is None:
+            return None
+        return max(rss or 0, working_set or 0)
+
+    def update(self, usage):
+        """ Current budget, given that the Buffer holds usage bytes """
+        now = monotonic()
+        if self._last is not None and now - self._last < self.interval:
+            return self.budget
+        self._last = now
+        used = self.used = self.measure()
+        if used is None:
+            self.budget = min(max(self.low * self.limit, self.minimum),
+                              self.maximum)
+            return self.budget
+        if not self._measured:
+            self._measured = True
+            budget = usage + max(self.high * self.limit - used, 0)
+        elif used > self.high * self.limit:
+            budget = min(self.budget, usage - (used - self.high * self.limit))
+        elif used < self.low * self.limit:
+            budget = max(self.budget, usage + (self.low * self.limit - used))
+        else:
+            return self.budget
+        self.budget = min(max(budget, self.minimum), self.maximum)
+        return self.budget
+
+    def stats(self):
+        return {'limit': self.limit,
+                'high': self.high * self.limit,
+                'low': self.low * self.limit,
+                'used': self.used,
+                'budget': self.budget}
@@ -3,15 +3,20 @@
 We put arrays on disk as raw bytes, extending along the first dimension.
 Alongside each array x we ensure the value x.dtype which stores the string
 description of the array's dtype.
+
+When backed by a ``File`` we may call ``get(..., memory_map=True)`` to
+receive read-only arrays that point directly into memory mapped files rather
+than copies on the heap.  See ``File._get`` for when these stay valid:
+touching one after its file was truncated kills the process.
 """
 from contextlib import suppress
-import pickle
 
 import numpy as np
 from toolz import valmap, identity, partial
 from .core import Interface
 from .file import File
-from .utils import frame, framesplit, suffix
+from .python import dumps, loads
+from .utils import frame, framesplit, iterframes, suffix
 
 
 def serialize_dtype(dt):
@@ -62,9 +67,46 @@ class Numpy(Interface):
         dtypes = map(parse_dtype, dtypes)
         return list(map(deserialize, bytes, dtypes))
 
+    def _pop(self, keys, **kwargs):
+        dtype_keys = [suffix(key, '.dtype') for key in keys]
+        raw = self.partd.pop(keys + dtype_keys, **kwargs)
+        dtypes = map(parse_dtype, raw[len(keys):])
+        return list(map(deserialize, raw[:len(keys)], dtypes))
+
+    def iter_chunks(self, key, **kwargs):
+        """ Iterate over pieces of the array stored under key
+
+        Object arrays come back one array per append.  Other arrays come in
+        whatever pieces the underlying partd yields, cut to whole items.
+        """
+        dt = self.partd.get(suffix(key, '.dtype'), **kwargs)
+        if not dt:
+            return
+        dt = parse_dtype(dt)
+        if dt == 'O':
+            for f in iterframes(self.partd.iter_chunks(key, **kwargs)):
+                yield deserialize_object_frame(f)
+            return
+        rest = b''
+        for chunk in self.partd.iter_chunks(key, **kwargs):
+            if rest:
+                chunk = rest + chunk
+            n = len(chunk) - len(chunk) % dt.itemsize
+            if n:
+                yield np.frombuffer(memoryview(chunk)[:n], dt)
+            rest = chunk[n:]
+
+    def keys(self, **kwargs):
+        return [key for key in self.partd.keys(**kwargs) if not is_dtype_key(key)]
+
+    def _nbytes(self, keys, **kwargs):
+        """ Serialized sizes, without dtype metadata """
+        return self.partd.nbytes(keys, **kwargs)
+
     def delete(self, keys, **kwargs):
         keys2 = [suffix(key, '.dtype') for key in keys]
         self.partd.delete(keys2, **kwargs)
+        self._iset_seen.difference_update(keys)
 
     def _iset(self, key, value):
         return self.partd._iset(key, value)
@@ -83,37 +125,37 @@ class Numpy(Interface):
         self.drop()
         self.partd.__exit__(self, *args)
 
-try:
-    from pandas import msgpack
-except ImportError:
-    try:
-        import msgpack
-    except ImportError:
-        msgpack = False
+
+def is_dtype_key(key):
+    """ Whether key holds the dtype of another key
+
+    >>> is_dtype_key('x.dtype'), is_dtype_key(('a', 'b.dtype')), is_dtype_key('x')
+    (True, True, False)
+    """
+    if isinstance(key, tuple) and key:
+        key = key[-1]
+    return str(key).endswith('.dtype')
 
 
 def serialize(x):
     if x.dtype == 'O':
-        l = x.flatten().tolist()
-        with suppress(Exception):  # Try msgpack (faster on strings)
-            return frame(msgpack.packb(l, use_bin_type=True))
-        return frame(pickle.dumps(l, protocol=pickle.HIGHEST_PROTOCOL))
+        # msgpack if it can (faster on strings), else pickle, tagged
+        return frame(dumps(x.flatten().tolist()))
     else:
         return x.tobytes()
 
 
+def deserialize_object_frame(f):
+    """ Object array from a single frame of serialized values """
+    block = loads(f)
+    result = np.empty(len(block), dtype='O')
+    result[:] = block
+    return result
+
+
 def deserialize(bytes, dtype, copy=False):
     if dtype == 'O':
-        try:
-            if msgpack.version >= (0, 5, 2):
-                unpack_kwargs = {'raw': False}
-            else:
-                unpack_kwargs = {'encoding': 'utf-8'}
-
-            blocks = [msgpack.unpackb(f, **unpack_kwargs)
-                      for f in framesplit(bytes)]
-        except Exception:
-            blocks = [pickle.loads(f) for f in framesplit(bytes)]
+        blocks = [loads(f) for f in framesplit(bytes)]
 
         result = np.empty(sum(map(len, blocks)), dtype='O')
         i = 0
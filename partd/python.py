@@ -3,6 +3,12 @@ get/put functions that consume/produce Python lists using msgpack or pickle
 to serialize.
 
 First we try msgpack (it's faster).  If that fails then we default to pickle.
+
+Serialized values start with a three byte header: a zero byte, the version
+of the header and a tag naming the format, so that we know how to load them
+without guessing.  Older versions wrote no header.  Their msgpack or pickle
+data never starts with a zero byte, other than the single byte that
+msgpack uses for 0, so we still read it by trial and error.
 """
 import pickle
 
@@ -19,21 +25,60 @@ from .encode import Encode
 from functools import partial
 
 
+VERSION = 1
+MSGPACK = 1
+PICKLE = 2
+
+if msgpack:
+    if msgpack.version >= (0, 5, 2):
+        unpack_kwargs = {'raw': False}
+    else:
+        unpack_kwargs = {'encoding': 'utf-8'}
+    msgpack_errors = (ValueError, msgpack.exceptions.UnpackException)
+
+
+def header(tag):
+    return bytes([0, VERSION, tag])
+
+
 def dumps(x):
-    try:
-        return msgpack.packb(x, use_bin_type=True)
-    except:
-        return pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL)
+    """ Serialize x with msgpack if it can, else with pickle
+
+    >>> loads(dumps([1, 'two', b'three']))
+    [1, 'two', b'three']
+    >>> dumps(1j)[:3] == header(PICKLE)
+    True
+    """
+    if msgpack:
+        try:
+            return header(MSGPACK) + msgpack.packb(x, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return header(PICKLE) + pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL)
+
 
 def loads(x):
-    try:
-        if msgpack.version >= (0, 5, 2):
-            unpack_kwargs = {'raw': False}
-        else:
-            unpack_kwargs = {'encoding': 'utf-8'}
-        return msgpack.unpackb(x, **unpack_kwargs)
-    except:
-        return pickle.loads(x)
+    """ Load bytes from dumps, or from dumps of older versions """
+    x = memoryview(x).cast('B')
+    if len(x) < 3 or x[0] != 0:
+        return loads_untagged(x)
+    if x[1] != VERSION:
+        raise ValueError("Unknown serialization header version %d" % x[1])
+    if x[2] == MSGPACK:
+        return msgpack.unpackb(x[3:], **unpack_kwargs)
+    elif x[2] == PICKLE:
+        return pickle.loads(x[3:])
+    raise ValueError("Unknown serialization format %d" % x[2])
+
+
+def loads_untagged(x):
+    """ Load msgpack or pickle data without a header, as written before """
+    if msgpack:
+        try:
+            return msgpack.unpackb(x, **unpack_kwargs)
+        except msgpack_errors:
+            pass
+    return pickle.loads(x)
 
 
 def concat(lists):
@@ -0,0 +1,396 @@
+""" Store many keys in a few large append-only segment files
+
+``File`` keeps one file per key.  With many keys this costs an inode and an
+open/close pair per key on every append.  ``SegmentFile`` instead appends the
+values of all keys onto a few large segment files and keeps an index from
+each key to the ``(segment, offset, length)`` extents that hold its bytes.
+
+The index lives in memory and is mirrored to an append-only journal within
+the directory, so other processes and pickled copies can rebuild it.
+Deleted bytes stay in their segments until ``compact`` rewrites the live
+extents into fresh segments.
+"""
+from contextlib import suppress
+import os
+import pickle
+import shutil
+import tempfile
+from threading import Lock
+
+import locket
+
+from .core import Interface
+from .file import cleanup_files
+from .utils import frame, framesplit, nbytes, writev
+
+
+class SegmentFile(Interface):
+    """ Log-structured on-disk partd
+
+    Parameters
+    ----------
+    path: str, optional
+        Directory in which to store segments.  Defaults to a temporary one.
+    dir: str, optional
+        Parent directory of the temporary directory
+    segment_size: int
+        Start a new segment once the active one grows beyond this many bytes
+
+    Examples
+    --------
+    >>> p = SegmentFile()
+    >>> p.append({'x': b'Hello', 'y': b'abc'})
+    >>> p.append({'x': b' World'})
+    >>> p.get(['x', 'y'])
+    [b'Hello World', b'abc']
+    >>> p.index['x']  # doctest: +SKIP
+    [(0, 0, 5), (0, 8, 6)]
+    """
+    _append_lists = True
+
+    def __init__(self, path=None, dir=None, segment_size=2**28):
+        if not path:
+            path = tempfile.mkdtemp(suffix='.partd', dir=dir)
+            cleanup_files.append(path)
+            self._explicitly_given_path = False
+        else:
+            self._explicitly_given_path = True
+        self.path = path
+        if not os.path.exists(path):
+            with suppress(OSError):
+                os.makedirs(path)
+        self.segment_size = segment_size
+        self.lock = locket.lock_file(os.path.join(path, '.lock'))
+        self._sync_lock = Lock()
+        self._dirty = set()
+        self._written = self._synced = 0
+        self._reset_index()
+        Interface.__init__(self)
+
+    def __getstate__(self):
+        return {'path': self.path, 'segment_size': self.segment_size}
+
+    def __setstate__(self, state):
+        Interface.__setstate__(self, state)
+        SegmentFile.__init__(self, state['path'],
+                             segment_size=state['segment_size'])
+
+    @property
+    def journal(self):
+        return os.path.join(self.path, 'index.journal')
+
+    def segment(self, i):
+        return os.path.join(self.path, '%08d.segment' % i)
+
+    def _reset_index(self):
+        self.index = dict()
+        self.active = 0
+        self.garbage = 0
+        self._journal_offset = 0
+        self._journal_inode = None
+
+    def _apply(self, record):
+        """ Apply one journal record to the in-memory index """
+        op, payload = record
+        if op == 'append':
+            for key, seg, offset, length in payload:
+                self.index.setdefault(key, []).append((seg, offset, length))
+                self.active = max(self.active, seg)
+        elif op == 'set':
+            key, seg, offset, length = payload
+            self.garbage += sum(n for _, _, n in self.index.get(key, ()))
+            self.index[key] = [(seg, offset, length)]
+            self.active = max(self.active, seg)
+        elif op == 'delete':
+            for key in payload:
+                if key in self.index:
+                    self.garbage += sum(n for _, _, n in self.index.pop(key))
+        else:
+            raise ValueError("Unknown journal record: %s" % op)
+
+    def _refresh(self):
+        """ Replay journal records written since we last looked
+
+        Other processes may have appended, compacted or dropped in the
+        meantime.  Must be called while holding the lock.
+        """
+        try:
+            st = os.stat(self.journal)
+        except FileNotFoundError:
+            self._reset_index()
+            return
+        if (st.st_ino != self._journal_inode or
+                st.st_size < self._journal_offset):
+            self._reset_index()
+            self._journal_inode = st.st_ino
+        if st.st_size > self._journal_offset:
+            with open(self.journal, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+            for record in framesplit(data):
+                self._apply(pickle.loads(record))
+            self._journal_offset += len(data)
+
+    def _log(self, records):
+        """ Record index changes in the journal and apply them """
+        data = b''.join(frame(pickle.dumps(r, protocol=pickle.HIGHEST_PROTOCOL))
+                        for r in records)
+        with open(self.journal, 'ab') as f:
+            f.write(data)
+        if self._journal_inode is None:
+            self._journal_inode = os.stat(self.journal).st_ino
+        self._journal_offset += len(data)
+        for record in records:
+            self._apply(record)
+
+    def _open_active(self):
+        """ Open the active segment for appending, rolling over when full """
+        f = open(self.segment(self.active), 'ab')
+        if f.tell() >= self.segment_size:
+            f.close()
+            self.active += 1
+            f = open(self.segment(self.active), 'ab')
+        return f
+
+    def append(self, data, lock=True, fsync=False, **kwargs):
+        """ Append bytes, or lists of bytes, onto many keys
+
+        With ``fsync=True`` the segments and journal are flushed to stable
+        storage before returning.  This costs a few fsyncs per call, not one
+        per key, and concurrent callers share them, see ``sync``.
+        """
+        if lock: self.lock.acquire()
+        try:
+            self._refresh()
+            extents = []
+            with self._open_active() as f:
+                offset = f.tell()
+                for k, v in data.items():
+                    writev(f, v)
+                    n = nbytes(v)
+                    extents.append((k, self.active, offset, n))
+                    offset += n
+            self._log([('append', extents)])
+            self._dirty.add(self.active)
+            self._written += 1
+            ticket = self._written
+        finally:
+            if lock: self.lock.release()
+        if fsync:
+            self.sync(ticket)
+
+    def sync(self, ticket=None):
+        """ Flush written segments and the journal to stable storage
+
+        This is a group commit.  Writers take a ticket after writing and a
+        single fsync covers every write that completed before it started.
+        A caller whose ticket was covered by another thread's fsync while it
+        waited returns without syncing again.
+        """
+        with self._sync_lock:
+            if ticket is not None and self._synced >= ticket:
+                return
+            target = self._written
+            segments = list(self._dirty)
+            self._dirty.difference_update(segments)
+            paths = [self.segment(seg) for seg in segments] + [self.journal]
+            for path in paths:
+                with suppress(FileNotFoundError):  # dropped meanwhile
+                    fd = os.open(path, os.O_RDWR)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            if os.name != 'nt':  # new files need their directory entries
+                fd = os.open(self.path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            self._synced = max(self._synced, target)
+
+    def _read(self, extents):
+        """ Read and join the bytes of several lists of extents """
+        return list(self._iread(extents))
+
+    def _iread(self, extents):
+        """ Bytes of several lists of extents, one list at a time """
+        files = dict()
+        try:
+            for ext in extents:
+                parts = []
+                for seg, offset, length in ext:
+                    if seg not in files:
+                        files[seg] = open(self.segment(seg), 'rb')
+                    f = files[seg]
+                    f.seek(offset)
+                    parts.append(f.read(length))
+                yield b''.join(parts)
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _get(self, keys, lock=True, **kwargs):
+        assert isinstance(keys, (list, tuple, set))
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            result = self._read([self.index.get(key, ()) for key in keys])
+        finally:
+            if lock:
+                self.lock.release()
+        return result
+
+    def iter_chunks(self, key, lock=True, **kwargs):
+        """ Iterate over the extents of key, one read per extent """
+        if lock:
+            self.lock.acquire()
+        files = dict()
+        try:
+            self._refresh()
+            extents = list(self.index.get(key, ()))
+            # Open now, compaction may remove segments once we release
+            for seg, _, _ in extents:
+                if seg not in files:
+                    files[seg] = open(self.segment(seg), 'rb')
+        except BaseException:
+            for f in files.values():
+                f.close()
+            raise
+        finally:
+            if lock:
+                self.lock.release()
+        try:
+            for seg, offset, length in extents:
+                f = files[seg]
+                f.seek(offset)
+                yield f.read(length)
+        finally:
+            for f in files.values():
+                f.close()
+
+    def keys(self, lock=True):
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            return list(self.index)
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _nbytes(self, keys, lock=True, **kwargs):
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            return [sum(n for _, _, n in self.index.get(key, ()))
+                    for key in keys]
+        finally:
+            if lock:
+                self.lock.release()
+
+    def stats(self, lock=True):
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            return {'nkeys': len(self.index),
+                    'nbytes': sum(n for extents in self.index.values()
+                                  for _, _, n in extents),
+                    'garbage': self.garbage,
+                    'nsegments': len({seg for extents in self.index.values()
+                                      for seg, _, _ in extents})}
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _iset(self, key, value, lock=True):
+        """ Idempotent set """
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            with self._open_active() as f:
+                offset = f.tell()
+                writev(f, value)
+            self._log([('set', (key, self.active, offset, nbytes(value)))])
+            self._dirty.add(self.active)
+            self._written += 1
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _delete(self, keys, lock=True):
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            keys = [key for key in keys if key in self.index]
+            if keys:
+                self._log([('delete', keys)])
+        finally:
+            if lock:
+                self.lock.release()
+
+    def compact(self, lock=True):
+        """ Rewrite live extents into fresh segments to reclaim deleted space
+
+        Every key ends up with a single contiguous extent.  Old segments are
+        removed once the new journal has replaced the old one.  We hold one
+        value in memory at a time.
+        """
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            old = set(seg for ext in self.index.values() for seg, _, _ in ext)
+            old.update(range(self.active + 1))
+            keys = list(self.index)
+            extents = []
+            values = self._iread(self.index[k] for k in keys)
+            f = None  # open new segments only once we have data for them
+            try:
+                for key, value in zip(keys, values):
+                    if f is None or f.tell() >= self.segment_size:
+                        if f is not None:
+                            f.close()
+                        self.active += 1
+                        f = open(self.segment(self.active), 'ab')
+                    extents.append((key, self.active, f.tell(), len(value)))
+                    f.write(value)
+            finally:
+                values.close()
+                if f is not None:
+                    f.close()
+
+            tmp = self.journal + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(frame(pickle.dumps(('append', extents),
+                                           protocol=pickle.HIGHEST_PROTOCOL)))
+            os.replace(tmp, self.journal)
+            for seg in old:
+                with suppress(FileNotFoundError):
+                    os.remove(self.segment(seg))
+            self._reset_index()
+            self._refresh()
+        finally:
+            if lock:
+                self.lock.release()
+
+    def drop(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        self._iset_seen.clear()
+        self._reset_index()
+        os.mkdir(self.path)
+
+    def __exit__(self, *args):
+        self.drop()
+        os.rmdir(self.path)
+
+    def __del__(self):
+        if not self._explicitly_given_path:
+            self.drop()
+            os.rmdir(self.path)
@@ -0,0 +1,373 @@
+""" Share a partd between the processes of one machine in shared memory
+
+``Dict`` lives in the heap of one process.  To share data between processes
+we otherwise go through files or through a ``Server``, which copies every
+byte over a socket.  ``SharedMemory`` keeps values in a block of
+``multiprocessing.shared_memory`` that every process on the machine can map.
+
+The block holds a small header, a journal of index changes and a data region.
+As in ``SegmentFile`` appends go onto the end of the data region and each
+process replays the journal into its own index from each key to the
+``(offset, length)`` extents holding its bytes.  A lock file in the temporary
+directory serializes writers across processes.
+"""
+from contextlib import suppress
+from multiprocessing import resource_tracker, shared_memory
+import os
+import pickle
+import struct
+import tempfile
+from threading import Lock
+
+from .core import Interface
+from .locks import file_lock
+from .utils import frame, framesplit, nbytes
+
+# generation, size of journal region, end of data, end of journal
+header = struct.Struct('QQQQ')
+
+# Blocks that we could not unmap yet because memoryviews into them are alive
+unclosed = list()
+
+
+def attach(name):
+    """ Attach to an existing block of shared memory
+
+    Python's resource tracker would otherwise unlink the block when this
+    process exits, from under the process that created it.
+    """
+    with suppress(TypeError):  # Python 3.13 and later
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if os.name != 'nt':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class SharedMemory(Interface):
+    """ Store keys in a block of shared memory
+
+    Pass the ``name`` of an existing partd, or pickle it, to use it from
+    another process.  The process that creates the block owns it and
+    removes it on ``__exit__``, or when collected if we chose the name.
+
+    When the data region fills up we compact it, moving live values to its
+    start, and raise ``MemoryError`` if they still do not fit.
+
+    ``get(..., copy=False)`` returns read-only memoryviews into the block
+    for keys held in one piece, as after a single append or a compaction.
+    They are valid only until the next compaction or ``drop``, in any
+    process.
+
+    Parameters
+    ----------
+    name: str, optional
+        Name of the block.  Defaults to a new, unique one.
+    size: int
+        Bytes of data the block can hold
+    index_size: int
+        Bytes reserved for the journal of index changes
+    """
+    _append_lists = True
+
+    def __init__(self, name=None, size=2**28, index_size=2**22):
+        self._explicitly_given_name = name is not None
+        self._created = False
+        while True:
+            try:
+                self.shm = attach(name) if name else None
+            except FileNotFoundError:
+                self.shm = None
+            if self.shm is not None:
+                break
+            try:
+                self.shm = shared_memory.SharedMemory(
+                    name, create=True, size=header.size + index_size + size)
+            except FileExistsError:  # someone else created it meanwhile
+                continue
+            self._created = True
+            break
+        self.name = self.shm.name
+        self.index_size = index_size
+        self.size = self.shm.size - header.size - index_size
+        self.lock = file_lock(self.lockfile)
+        self._index_lock = Lock()
+        self._reset_index()
+        with self.lock:
+            generation, stored, end, journal_end = self._header()
+            if self._created:
+                self._write_header(generation, index_size, end, journal_end)
+            elif stored and stored != index_size:
+                raise ValueError("Shared memory %s has index_size %d, not %d"
+                                 % (self.name, stored, index_size))
+        Interface.__init__(self)
+
+    def __getstate__(self):
+        return {'name': self.name, 'size': self.size,
+                'index_size': self.index_size}
+
+    def __setstate__(self, state):
+        Interface.__setstate__(self, state)
+        SharedMemory.__init__(self, state['name'], size=state['size'],
+                              index_size=state['index_size'])
+
+    @property
+    def lockfile(self):
+        return os.path.join(tempfile.gettempdir(),
+                            'partd-%s.lock' % self.name.lstrip('/'))
+
+    def _header(self):
+        return header.unpack_from(self.shm.buf)
+
+    def _write_header(self, *values):
+        header.pack_into(self.shm.buf, 0, *values)
+
+    def _data(self, offset, length):
+        start = header.size + self.index_size + offset
+        return self.shm.buf[start:start + length]
+
+    def _reset_index(self):
+        self.index = dict()
+        self.garbage = 0
+        self._generation = None
+        self._journal_offset = 0
+
+    def _apply(self, record):
+        """ Apply one journal record to the in-memory index """
+        op, payload = record
+        if op == 'append':
+            for key, offset, length in payload:
+                self.index.setdefault(key, []).append((offset, length))
+        elif op == 'set':
+            key, offset, length = payload
+            self.garbage += sum(n for _, n in self.index.get(key, ()))
+            self.index[key] = [(offset, length)]
+        elif op == 'delete':
+            for key in payload:
+                if key in self.index:
+                    self.garbage += sum(n for _, n in self.index.pop(key))
+        else:
+            raise ValueError("Unknown journal record: %s" % op)
+
+    def _refresh(self):
+        """ Replay journal records written since we last looked
+
+        Must be called while holding the lock, shared or exclusive.
+        """
+        generation, _, _, journal_end = self._header()
+        with self._index_lock:  # readers in our process may race here
+            if generation != self._generation:
+                self._reset_index()
+                self._generation = generation
+            if journal_end > self._journal_offset:
+                start = header.size + self._journal_offset
+                data = bytes(self.shm.buf[start:header.size + journal_end])
+                for record in framesplit(data):
+                    self._apply(pickle.loads(record))
+                self._journal_offset = journal_end
+
+    def _commit(self, values, records):
+        """ Write values onto the data region and log records about them
+
+        ``records`` is a function from the offset at which the values will
+        land to a list of journal records.  Compacts if either region is
+        full.  Must be called while holding the lock exclusively.
+        """
+        n = sum(map(nbytes, values))
+        for attempt in range(2):
+            generation, _, end, journal_end = self._header()
+            rs = records(end)
+            journal = b''.join(frame(pickle.dumps(
+                r, protocol=pickle.HIGHEST_PROTOCOL)) for r in rs)
+            if (end + n <= self.size and
+                    journal_end + len(journal) <= self.index_size):
+                break
+            if attempt:
+                raise MemoryError("Shared memory %s is full" % self.name)
+            self._compact()
+        offset = end
+        for v in values:
+            for b in (v if isinstance(v, (list, tuple)) else [v]):
+                b = memoryview(b).cast('B')
+                self._data(offset, len(b))[:] = b
+                offset += len(b)
+        start = header.size + journal_end
+        self.shm.buf[start:start + len(journal)] = journal
+        self._write_header(generation, self.index_size, end + n,
+                           journal_end + len(journal))
+        self._refresh()
+
+    def _compact(self):
+        """ Move live values to the start of the data region """
+        self._refresh()
+        keys = list(self.index)
+        values = self._read([self.index[key] for key in keys])
+        extents = []
+        offset = 0
+        for key, value in zip(keys, values):
+            self._data(offset, len(value))[:] = value
+            extents.append((key, offset, len(value)))
+            offset += len(value)
+        journal = frame(pickle.dumps(('append', extents),
+                                     protocol=pickle.HIGHEST_PROTOCOL))
+        if len(journal) > self.index_size:
+            raise MemoryError("Index of shared memory %s is full" % self.name)
+        self.shm.buf[header.size:header.size + len(journal)] = journal
+        generation = self._header()[0]
+        self._write_header(generation + 1, self.index_size, offset,
+                           len(journal))
+        self._refresh()
+
+    def compact(self, lock=True):
+        """ Move live values to the start of the data region
+
+        Happens by itself when the block fills up.
+        """
+        if lock:
+            self.lock.acquire()
+        try:
+            self._compact()
+        finally:
+            if lock:
+                self.lock.release()
+
+    def append(self, data, lock=True, **kwargs):
+        """ Append bytes, or lists of bytes, onto many keys """
+        keys, values = list(data.keys()), list(data.values())
+
+        def records(offset):
+            extents = []
+            for key, value in zip(keys, values):
+                n = nbytes(value)
+                extents.append((key, offset, n))
+                offset += n
+            return [('append', extents)]
+
+        if lock: self.lock.acquire()
+        try:
+            self._refresh()
+            self._commit(values, records)
+        finally:
+            if lock: self.lock.release()
+
+    def _read(self, extents, copy=True):
+        """ Bytes of several lists of extents, or views if copy=False """
+        result = []
+        for ext in extents:
+            if not copy and len(ext) == 1:
+                result.append(self._data(*ext[0]).toreadonly())
+            else:
+                result.append(b''.join(self._data(offset, length)
+                                       for offset, length in ext))
+        return result
+
+    def _get(self, keys, lock=True, copy=True, **kwargs):
+        assert isinstance(keys, (list, tuple, set))
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            self._refresh()
+            result = self._read([self.index.get(key, ()) for key in keys],
+                                copy=copy)
+        finally:
+            if lock:
+                self.lock.release()
+        return result
+
+    def keys(self, lock=True):
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            self._refresh()
+            return list(self.index)
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _nbytes(self, keys, lock=True, **kwargs):
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            self._refresh()
+            return [sum(n for _, n in self.index.get(key, ()))
+                    for key in keys]
+        finally:
+            if lock:
+                self.lock.release()
+
+    def stats(self, lock=True):
+        if lock:
+            self.lock.acquire(shared=True)
+        try:
+            self._refresh()
+            _, _, end, journal_end = self._header()
+            return {'nkeys': len(self.index),
+                    'nbytes': end - self.garbage,
+                    'garbage': self.garbage,
+                    'size': self.size,
+                    'index_nbytes': journal_end,
+                    'index_size': self.index_size}
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _iset(self, key, value, lock=True):
+        """ Idempotent set """
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            self._commit([value],
+                         lambda offset: [('set', (key, offset, nbytes(value)))])
+        finally:
+            if lock:
+                self.lock.release()
+
+    def _delete(self, keys, lock=True):
+        if lock:
+            self.lock.acquire()
+        try:
+            self._refresh()
+            keys = [key for key in keys if key in self.index]
+            if keys:
+                self._commit([], lambda offset: [('delete', keys)])
+        finally:
+            if lock:
+                self.lock.release()
+
+    def drop(self):
+        with self.lock:
+            generation = self._header()[0]
+            self._write_header(generation + 1, self.index_size, 0, 0)
+            self._refresh()
+        self._iset_seen.clear()
+
+    def close(self):
+        """ Unmap the block, and remove it if we created it """
+        if self.shm is None:
+            return
+        shm, self.shm = self.shm, None
+        try:
+            shm.close()
+        except BufferError:  # views from get(copy=False) are still alive
+            unclosed.append(shm)
+        if self._created:
+            if os.name != 'nt':
+                # Processes attached to the same tracker, like our children,
+                # may have unregistered the block.  Unlinking unregisters.
+                resource_tracker.register(shm._name, 'shared_memory')
+            with suppress(FileNotFoundError):
+                shm.unlink()
+            with suppress(OSError):
+                os.remove(self.lockfile)
+
+    def __exit__(self, *args):
+        self.drop()
+        self.close()
+
+    def __del__(self):
+        if getattr(self, 'shm', None) is None:
+            return
+        if self._explicitly_given_name:
+            self._created = False  # leave it for others to use
+        self.close()
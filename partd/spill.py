@@ -0,0 +1,185 @@
+""" Policies that choose which keys a Buffer spills to its slow partd
+
+A ``Buffer`` tells its policy whenever a key in its fast partd grows, is read
+or leaves, and asks it for victims when memory runs low.  The Buffer
+serializes these calls.
+
+>>> p = LRU()
+>>> p.add('x', 10)
+>>> p.add('y', 20)
+>>> p.touch(['x'])
+>>> p.victims(10)
+['y']
+"""
+from collections import OrderedDict
+import heapq
+
+
+def take(keys, lengths, nbytes, maxcount):
+    """ Leading keys up to a total of about nbytes, at least one
+
+    >>> take('abc', {'a': 5, 'b': 5, 'c': 5}, 10, 5)
+    ['a', 'b']
+    >>> take('abc', {'a': 5, 'b': 5, 'c': 5}, 1, 5)
+    ['a']
+    """
+    result = []
+    total = 0
+    for key in keys:
+        n = lengths[key]
+        if len(result) >= maxcount or (result and total + n > nbytes):
+            break
+        result.append(key)
+        total += n
+    return result
+
+
+class SpillPolicy:
+    """ Base class of spill policies, spilling the oldest keys first """
+    name = None
+
+    def __init__(self):
+        self.lengths = dict()
+
+    def add(self, key, length):
+        """ key was appended to and now holds length bytes """
+        self.lengths[key] = length
+
+    def touch(self, keys):
+        """ keys were read from the fast partd """
+
+    def remove(self, key):
+        """ key left the fast partd """
+        self.lengths.pop(key, None)
+
+    def victims(self, nbytes, maxcount=100000):
+        """ Keys to spill, holding about nbytes between them """
+        return take(iter(self.lengths), self.lengths, nbytes, maxcount)
+
+
+class FIFO(SpillPolicy):
+    """ Spill the keys that entered the buffer first """
+    name = 'fifo'
+
+
+class LRU(SpillPolicy):
+    """ Spill the keys least recently appended to or read """
+    name = 'lru'
+
+    def __init__(self):
+        self.lengths = OrderedDict()
+
+    def add(self, key, length):
+        self.lengths[key] = length
+        self.lengths.move_to_end(key)
+
+    def touch(self, keys):
+        for key in keys:
+            if key in self.lengths:
+                self.lengths.move_to_end(key)
+
+
+class HeapPolicy(SpillPolicy):
+    """ Spill keys in order of a priority, lowest first
+
+    We keep a heap of ``(priority, tiebreaker, key)`` and push a new entry
+    whenever a priority changes.  Outdated entries are skipped when popped
+    and the heap is rebuilt once they outnumber the live keys, so choosing
+    k victims out of n keys costs O(k log n).
+    """
+    def __init__(self):
+        SpillPolicy.__init__(self)
+        self._rebuild()
+
+    def priority(self, key):
+        raise NotImplementedError()
+
+    def _rebuild(self):
+        self._heap = [(self.priority(k), i, k)
+                      for i, k in enumerate(self.lengths)]
+        heapq.heapify(self._heap)
+        self._tick = len(self._heap)
+
+    def _push(self, key):
+        self._tick += 1
+        heapq.heappush(self._heap, (self.priority(key), self._tick, key))
+        if len(self._heap) > 2 * len(self.lengths) + 1000:
+            self._rebuild()
+
+    def add(self, key, length):
+        SpillPolicy.add(self, key, length)
+        self._push(key)
+
+    def _candidates(self, popped):
+        seen = set()
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            p, _, key = entry
+            if (key in seen or key not in self.lengths or
+                    p != self.priority(key)):  # outdated
+                continue
+            seen.add(key)
+            popped.append(entry)
+            yield key
+
+    def victims(self, nbytes, maxcount=100000):
+        popped = []
+        result = take(self._candidates(popped), self.lengths, nbytes,
+                      maxcount)
+        chosen = set(result)
+        for entry in popped:
+            if entry[2] not in chosen:
+                heapq.heappush(self._heap, entry)
+        return result
+
+
+class Largest(HeapPolicy):
+    """ Spill the largest keys, so that few writes free much memory """
+    name = 'largest'
+
+    def priority(self, key):
+        return -self.lengths[key]
+
+
+class LFU(HeapPolicy):
+    """ Spill the keys appended to and read least often """
+    name = 'lfu'
+
+    def __init__(self):
+        self.counts = dict()
+        HeapPolicy.__init__(self)
+
+    def priority(self, key):
+        return self.counts[key]
+
+    def add(self, key, length):
+        self.counts[key] = self.counts.get(key, 0) + 1
+        HeapPolicy.add(self, key, length)
+
+    def touch(self, keys):
+        for key in keys:
+            if key in self.lengths:
+                self.counts[key] += 1
+                self._push(key)
+
+    def remove(self, key):
+        HeapPolicy.remove(self, key)
+        self.counts.pop(key, None)
+
+
+policies = {cls.name: cls for cls in [Largest, LRU, FIFO, LFU]}
+
+
+def spill_policy(policy):
+    """ Policy object from a name or an existing policy
+
+    >>> spill_policy('lru')  # doctest: +ELLIPSIS
+    <partd.spill.LRU object at ...>
+    """
+    if isinstance(policy, SpillPolicy):
+        return policy
+    try:
+        return policies[policy]()
+    except KeyError:
+        raise ValueError("Unknown spill policy %r, choose one of %s"
+                         % (policy, ', '.join(sorted(policies))))
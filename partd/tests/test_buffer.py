@@ -1,3 +1,5 @@
+import pytest
+
 from partd.dict import Dict
 from partd.file import File
 from partd.buffer import Buffer, keys_to_flush
@@ -52,3 +54,181 @@ def test_pickle():
             assert d.fast.data == c.fast.data
             assert hasattr(d, 'slow')
             assert d.slow.path == c.slow.path
+
+
+def test_write_behind():
+    with Buffer(Dict(), File(), available_memory=10, write_behind=2) as p:
+        for i in range(20):
+            p.append({'x': b'Hello', 'y': b'abc', i % 3: b'123'})
+        assert p.get('x') == b'Hello' * 20
+        assert p.get(['y', 1]) == [b'abc' * 20, b'123' * 7]
+        assert p.memory_usage <= 10
+
+        p.flush(block=True)
+        assert not p._writer.pending
+        assert p.slow.get('x') == b'Hello' * 20
+
+        p.delete(['x'])
+        assert p.get('x') == b''
+
+        q = pickle.loads(pickle.dumps(p))
+        assert q.write_behind == 2
+        assert q.get('y') == b'abc' * 20
+
+
+def test_iter_chunks():
+    with Buffer(Dict(), Dict(), available_memory=10) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!', 'y': b'def'})
+        p.append({'x': b'123'})
+        assert p.fast.get('x') == b'123'
+        assert list(p.iter_chunks('x')) == [b'HelloWorld!', b'123']
+        assert b''.join(p.iter_chunks('y')) == b'abcdef'
+        assert list(p.iter_chunks('z')) == []
+
+
+def test_keys_and_nbytes():
+    with Buffer(Dict(), Dict(), available_memory=10) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!', 'z': b'12'})
+        assert sorted(p.keys()) == ['x', 'y', 'z']
+        assert p.nbytes(['x', 'y', 'w']) == [11, 3, 0]
+        stats = p.stats()
+        assert stats['nkeys'] == 3
+        assert stats['nbytes'] == 16
+        assert stats['fast']['nbytes'] == stats['memory_usage'] <= 10
+
+
+def test_pop():
+    with Buffer(Dict(), File(), available_memory=10) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!', 'z': b'12'})
+        assert p.pop(['x', 'y']) == [b'HelloWorld!', b'abc']
+        assert p.get(['x', 'y', 'z']) == [b'', b'', b'12']
+        assert p.memory_usage == 2
+        assert 'x' not in p.lengths
+
+
+@pytest.mark.parametrize('policy', ['largest', 'lru', 'fifo', 'lfu'])
+def test_policies(policy):
+    with Buffer(Dict(), Dict(), available_memory=100, policy=policy,
+                spill_fraction=0.2, spill_maxcount=5) as p:
+        for i in range(50):
+            p.append({i % 13: b'x' * (i % 7 + 1)})
+            p.get([0, 1])
+        assert p.memory_usage == sum(p.lengths.values()) <= 100
+        assert p.memory_usage == sum(map(len, p.fast.get(list(range(13)))))
+        assert set(p.policy.lengths) == set(p.lengths)
+        assert p.get(list(range(13))) == \
+            [b''.join(b'x' * (i % 7 + 1) for i in range(k, 50, 13))
+             for k in range(13)]
+        c = p.stats()['counters']
+        assert c['spills'] > 0 and c['hits'] + c['misses'] > 0
+        p.drop()
+        assert p.memory_usage == 0 and not p.policy.lengths
+
+
+def test_lru_keeps_recently_read_keys():
+    with Buffer(Dict(), Dict(), available_memory=30, policy='lru') as p:
+        p.append({'a': b'x' * 10, 'b': b'x' * 10, 'c': b'x' * 10})
+        p.get('a')
+        p.append({'d': b'x' * 10})
+        assert sorted(p.lengths) == ['a', 'c', 'd']
+        assert p.counters['hits'] == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Buffer(Dict(), Dict(), policy='random')
+
+
+def test_heap_matches_keys_to_flush():
+    import random
+    rng = random.Random(0)
+    p = Buffer(Dict(), Dict(), available_memory=1e9)
+    for i in range(2000):
+        k = rng.randrange(300)
+        p.append({k: b'x' * rng.randrange(1, 50)})
+        if i % 100 == 0:
+            p.flush([rng.choice(list(p.lengths))])
+    for fraction in [0.01, 0.1, 0.5]:
+        expected = keys_to_flush(p.lengths, fraction, maxcount=20)
+        assert [p.lengths[k] for k in p._keys_to_flush(fraction, 20)] == \
+            [p.lengths[k] for k in expected]
+        p.policy._rebuild()
+    assert len(p.policy._heap) <= 2 * len(p.lengths) + 1000
+
+
+class CountingDict(Dict):
+    def __init__(self):
+        Dict.__init__(self)
+        self.requested = []
+
+    def _get(self, keys, **kwargs):
+        self.requested.extend(keys)
+        return Dict._get(self, keys, **kwargs)
+
+    def _delete(self, keys, **kwargs):
+        self.requested.extend(keys)
+        return Dict._delete(self, keys, **kwargs)
+
+
+def test_spilled_keys_skip_slow():
+    slow = CountingDict()
+    with Buffer(Dict(), slow, available_memory=10) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        assert p.get(['x', 'y']) == [b'Hello', b'abc']
+        p.delete(['y'])
+        assert slow.requested == []
+
+        p.append({'x': b'World!'})
+        assert p.spilled == {'x'}
+        assert p.get(['x', 'z']) == [b'HelloWorld!', b'']
+        assert list(p.iter_chunks('z')) == []
+        assert slow.requested == ['x']
+        assert sorted(p.keys()) == ['x']
+
+        p.delete(['x', 'z'])
+        assert slow.requested == ['x', 'x']
+        assert p.spilled == set()
+
+
+def test_spilled_unknown_with_nonempty_slow():
+    slow = Dict()
+    slow.append({'x': b'old'})
+    with Buffer(Dict(), slow) as p:
+        assert p.spilled is None
+        p.append({'x': b'new'})
+        assert p.get('x') == b'newold'
+
+
+def test_spilled_does_not_list_slow_keys():
+    class UnlistedFile(File):
+        def keys(self, lock=True):
+            raise AssertionError("listed every key")
+
+    with UnlistedFile() as slow:
+        assert Buffer(Dict(), slow).spilled == set()
+        slow.append({('a', 'b'): b'old'})
+        assert Buffer(Dict(), slow).spilled is None
+
+
+def test_cascade():
+    from partd import ZLib
+    from partd.buffer import cascade
+    with File() as disk:
+        p = cascade([(Dict(), 1000), (ZLib(Dict()), 2000, {'policy': 'lru'})],
+                    disk)
+        for i in range(100):
+            p.append({i % 10: b'abcdefghij' * 50})
+        middle = p.slow
+        assert middle.policy.name == 'lru'
+        assert p.memory_usage <= 1000
+        assert middle.memory_usage <= 2000
+        assert middle.memory_usage == sum(middle.fast.nbytes(list(range(10))))
+        # holds more data than its budget, compressed
+        raw = sum(map(len, middle.fast.get(list(range(10)))))
+        assert raw > 2 * middle.memory_usage
+        assert sorted(map(len, p.get(list(range(10))))) == [5000] * 10
+        assert p.stats()['slow']['fast']['nbytes'] == middle.memory_usage
+        p.drop()
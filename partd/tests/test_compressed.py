@@ -1,10 +1,14 @@
 from partd.compressed import ZLib
+from partd.dict import Dict
+from partd.utils import frame
 
 
 import shutil
 import os
 import pickle
 
+import pytest
+
 
 def test_partd():
     with ZLib() as p:
@@ -29,3 +33,104 @@ def test_pickle():
         p.append({'x': b'123'})
         q = pickle.loads(pickle.dumps(p))
         assert q.get('x') == b'123'
+
+
+def test_lz4():
+    pytest.importorskip('lz4')
+    from partd.compressed import LZ4
+    for level in [0, 9]:
+        with LZ4(Dict(), level=level) as p:
+            p.append({'x': b'Hello' * 100, 'y': b'abc'})
+            p.append({'x': b'World!'})
+            assert p.get(['x', 'y']) == [b'Hello' * 100 + b'World!', b'abc']
+            assert p.nbytes('x') < 500
+            q = pickle.loads(pickle.dumps(p))
+            assert q.level == level and q.get('y') == b'abc'
+
+
+def test_zstd():
+    pytest.importorskip('zstandard')
+    from partd.compressed import Zstd
+    with Zstd(Dict(), level=-1) as p:
+        p.append({'x': b'Hello' * 100})
+        assert p.get('x') == b'Hello' * 100
+        assert p.nbytes('x') < 100
+
+
+def test_zstd_dictionary():
+    pytest.importorskip('zstandard')
+    from partd.compressed import Zstd
+    data = {i: ('{"id": %d, "name": "user-%d", "active": %s}'
+                % (i, i, i % 3 == 0)).encode() for i in range(2000)}
+    expected = list(data.values())
+
+    with Zstd(Dict()) as plain:
+        plain.append(data)
+        plain_nbytes = plain.stats()['nbytes']
+
+    with Zstd(Dict(), dict_size=2**12, train_on=500) as p:
+        p.append({k: data[k] for k in range(100)})
+        assert p.dictionary is None  # still collecting samples
+        for i in range(100, 2000, 100):
+            p.append({k: data[k] for k in range(i, i + 100)})
+        assert p.dictionary is not None
+        assert p.get(list(data)) == expected
+        assert sorted(p.keys()) == list(data)
+        assert sum(p.nbytes(list(data))) < 0.8 * plain_nbytes
+
+        q = pickle.loads(pickle.dumps(p))
+        assert q.get(list(data)) == expected
+
+        r = Zstd(p.partd)  # finds the dictionary in the partd
+        assert r.get(list(data)) == expected
+
+        p.drop()
+        assert p.dictionary is None and p.keys() == []
+
+
+def test_adaptive():
+    from partd.compressed import Adaptive
+    text = b'Hello, World! ' * 1000
+    noise = os.urandom(10000)
+    with Adaptive(Dict(), bandwidth=1, nsamples=2) as p:
+        p.append({'text': text, 'noise': noise})
+        assert p.report()['text']['codec'] is None  # still sampling
+        p.append({'text': text, 'noise': noise})
+        p.append({'text': text, 'noise': noise})
+        report = p.report()
+        assert report['text']['codec'] in ('fast', 'strong')
+        assert report['text']['ratio'] > 10
+        assert report['noise']['codec'] == 'none'
+        assert report['noise']['ratio'] < 1
+        assert p.stats()['codecs']['none'] == 1
+
+        assert p.get(['text', 'noise']) == [text * 3, noise * 3]
+        assert list(p.iter_chunks('noise')) == [noise] * 3
+        q = pickle.loads(pickle.dumps(p))
+        assert q.get('text') == text * 3
+        assert q.report() == report
+
+        p.delete('text')
+        assert 'text' not in p.report()
+
+
+def test_adaptive_uncompressed_when_storage_is_fast():
+    from partd.compressed import Adaptive
+    with Adaptive(Dict(), bandwidth=float('inf'), nsamples=1) as p:
+        p.append({'x': b'a' * 1000})
+        p.iset('y', b'b' * 1000)
+        assert p.report()['x']['codec'] == 'none'
+        assert p.get(['x', 'y']) == [b'a' * 1000, b'b' * 1000]
+
+
+def test_adaptive_frames_are_tagged():
+    from partd.compressed import Adaptive, adaptive_decode
+    import zlib
+    with Adaptive(Dict(), fast=('zlib', 1), strong=('zlib', 9)) as p:
+        p.partd.append({'x': frame(b'\x00Hello, ') +
+                             frame(b'\x01' + zlib.compress(b'World'))})
+        assert p.get('x') == b'Hello, World'
+    with pytest.raises(ValueError):
+        adaptive_decode(b'\xffHello')
+    with pytest.raises(ValueError):
+        Adaptive(Dict(), strong=('foo', 1))
@@ -1,5 +1,6 @@
 from partd.dict import Dict
 
+import pickle
 import shutil
 import os
 
@@ -39,3 +40,99 @@ def test_delete_non_existent_key():
         p.append({'x': b'123'})
         p.delete(['x', 'y'])
         assert p.get(['x', 'y']) == [b'', b'']
+
+
+def test_concurrent_gets_share_lock():
+    from threading import Thread
+    with Dict() as p:
+        p.append({'x': b'123'})
+        p.lock.acquire(shared=True)
+        try:
+            t = Thread(target=p.get, args=(['x'],))
+            t.start()
+            t.join(0.2)
+            assert not t.is_alive()
+
+            t = Thread(target=p.append, args=({'x': b'456'},))
+            t.start()
+            t.join(0.2)
+            assert t.is_alive()
+        finally:
+            p.lock.release()
+        t.join()
+        assert p.get('x') == b'123456'
+
+
+def test_iter_chunks():
+    with Dict() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        assert list(p.iter_chunks('x')) == [b'HelloWorld!']
+        assert list(p.iter_chunks('z')) == []
+
+
+def test_async():
+    import asyncio
+
+    async def f(p):
+        await asyncio.gather(*[p.aappend({'x': b'1'}) for i in range(10)])
+        assert await p.aget(['x', ['y']]) == [b'1' * 10, [b'']]
+        await p.adelete(['x'])
+        assert await p.aget('x') == b''
+        await p.aappend({'x': b'1'})
+        await p.adrop()
+        assert not p.data
+
+    with Dict() as p:
+        asyncio.run(f(p))
+
+
+def test_keys_and_nbytes():
+    with Dict() as p:
+        p.append({'x': b'Hello', ('a', 'b'): b'abc'})
+        p.append({'x': b'World!'})
+        assert p.keys() == ['x', ('a', 'b')]
+        assert p.nbytes(['x', ('a', 'b'), 'z']) == [11, 3, 0]
+        assert p.stats() == {'nkeys': 2, 'nbytes': 14}
+
+
+def test_pop():
+    with Dict() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        assert p.pop(['x', 'z']) == [b'HelloWorld!', b'']
+        assert p.keys() == ['y']
+
+
+def test_get_without_copy():
+    with Dict() as p:
+        p.append({'x': b'Hello'})
+        [view] = p.get(['x'], copy=False)
+        assert isinstance(view, memoryview) and view.readonly
+        assert view == b'Hello'
+
+        p.append({'x': b' World'})  # must not resize under the view
+        assert view == b'Hello'
+        assert p.get('x') == b'Hello World'
+        assert p.get('y', copy=False) == b''
+
+
+def test_pickle():
+    with Dict() as p:
+        p.append({'x': b'Hello'})
+        q = pickle.loads(pickle.dumps(p))
+        q.append({'x': b'!'})
+        assert q.get('x') == b'Hello!'
+
+        q.__setstate__({'data': {'x': [b'a', b'b']}})  # older format
+        assert q.get('x') == b'ab'
+
+
+def test_append_lists():
+    with Dict() as p:
+        p.append({'x': [b'Hello', memoryview(b' ')], 'y': b'abc'})
+        [view] = p.get(['x'], copy=False)
+        p.append({'x': [b'World', b'!']})
+        assert view == b'Hello '
+        p.iset('z', [b'1', b'23'])
+        assert p.get(['x', 'y', 'z']) == [b'Hello World!', b'abc', b'123']
@@ -26,3 +26,83 @@ def test_ensure():
         p.iset('x', b'123')
         p.iset('x', b'123')
         assert p.get('x') == b'123'
+
+
+def test_iter_chunks():
+    with Encode(zlib.compress, zlib.decompress, b''.join) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        assert list(p.iter_chunks('x')) == [b'Hello', b'World!']
+        assert list(p.iter_chunks('x', blocksize=5)) == [b'Hello', b'World!']
+        assert list(p.iter_chunks('z')) == []
+
+
+def test_keys_and_nbytes():
+    with Encode(zlib.compress, zlib.decompress, b''.join) as p:
+        p.append({'x': b'a' * 1000})
+        assert p.keys() == ['x']
+        assert 0 < p.nbytes('x') < 1000
+        assert p.stats()['nkeys'] == 1
+
+
+def test_pop():
+    with Encode(zlib.compress, zlib.decompress, b''.join) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        assert p.pop('x') == b'HelloWorld!'
+        assert p.get(['x', 'y']) == [b'', b'abc']
+
+
+def test_frames_go_down_as_lists():
+    from partd.dict import Dict
+    from partd.pickle import Pickle
+    appended = []
+
+    class RecordingDict(Dict):
+        def append(self, data, **kwargs):
+            appended.extend(data.values())
+            Dict.append(self, data, **kwargs)
+
+    with Encode(zlib.compress, zlib.decompress, b''.join,
+                RecordingDict()) as p:
+        p.append({'x': b'Hello'})
+        p.append({'x': b'World!'})
+        assert p.get('x') == b'HelloWorld!'
+        assert all(isinstance(v, list) for v in appended)
+
+    with Pickle(Encode(zlib.compress, zlib.decompress, b''.join,
+                       RecordingDict())) as p:
+        p.append({'x': [1, 2]})
+        p.iset('y', [3])
+        assert p.get(['x', 'y']) == [[1, 2], [3]]
+
+
+def test_encode_under_buffer():
+    from partd import Buffer, Dict, Python, ZLib, cascade
+    for make in [lambda: Buffer(ZLib(Dict()), File()),
+                 lambda: cascade([(ZLib(Dict()), 1e9)], File()),
+                 lambda: Buffer(Dict(), ZLib(Dict()), available_memory=10)]:
+        with Python(make()) as p:
+            p.append({'x': [1, 2]})
+            p.iset('y', [3])
+            p.append({'x': [4]})
+            assert p.get(['x', 'y']) == [[1, 2, 4], [3]]
+
+
+def test_nthreads():
+    import pickle
+    from partd.dict import Dict
+    data = {i: str(i).encode() * 1000 for i in range(100)}
+    with Encode(zlib.compress, zlib.decompress, b''.join, Dict(),
+                nthreads=4) as p:
+        p.append(data)
+        p.append({i: b'!' for i in range(0, 100, 2)})
+        expected = [v + b'!' * (i % 2 == 0) for i, v in data.items()]
+        assert p.get(list(data)) == expected
+        assert p._executor is not None
+
+        q = pickle.loads(pickle.dumps(p))
+        assert q.nthreads == 4 and q._executor is None
+        assert q.get(list(data)) == expected
+
+        assert p.pop([1, 0]) == [expected[1], expected[0]]
@@ -1,6 +1,10 @@
-from partd.file import File
+import pytest
 
+from partd.file import File, filename
+
+import pickle
 import shutil
+from threading import Thread
 import os
 
 
@@ -78,3 +82,365 @@ def test_del():
 def test_specify_dirname():
     with File(dir=os.getcwd()) as f:
         assert os.getcwd() in f.path
+
+
+def test_handle_cache():
+    with File(max_open_files=2) as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!', 'y': b'def'})
+        assert len(p._handles) == 2
+        assert p.get(['y', 'x']) == [b'abcdef', b'HelloWorld!']
+
+        p.append({'z': b'123', ('a', 'b'): b'456'})
+        assert len(p._handles) == 2
+        assert p.get(['x', 'y', 'z', ('a', 'b')]) == [b'HelloWorld!',
+                                                      b'abcdef',
+                                                      b'123', b'456']
+        assert p.get('w') == b''
+        assert not os.path.exists(p.filename('w'))
+
+        p.delete(['x'])
+        assert p.filename('x') not in p._handles
+        assert p.get('x') == b''
+        p.append({'x': b'new'})
+        assert p.get('x') == b'new'
+
+        p.iset('i', b'1')
+        p.append({'i': b'2'})
+        assert p.get('i') == b'12'
+
+        p.drop()
+        assert not p._handles
+        p.append({('a', 'b'): b'789'})
+        assert p.get(('a', 'b')) == b'789'
+
+
+def test_handle_cache_pickle():
+    with File(max_open_files=10) as p:
+        p.append({'x': b'123'})
+        q = pickle.loads(pickle.dumps(p))
+        assert q.max_open_files == 10
+        assert q.get('x') == b'123'
+        q._close()
+
+
+def test_memory_map():
+    with File() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        p.iset('e', b'')
+
+        x, y, z, e = p.get(['x', 'y', 'z', 'e'], memory_map=True)
+        assert isinstance(x, memoryview)
+        assert x.readonly
+        assert x == b'HelloWorld!'
+        assert y == b'abc'
+        assert z == b'' and e == b''
+        del x, y
+
+
+def test_memory_map_survives_iset_and_pop():
+    # A truncated mapping would kill the interpreter, so look from outside
+    code = """if 1:
+        from partd import File
+        for kwargs in [{}, {'max_open_files': 4}]:
+            with File(**kwargs) as p:
+                p.append({'x': b'x' * 100000})
+                x = p.get('x', memory_map=True)
+                p.iset('x', b'y')
+                assert x == b'x' * 100000
+                assert p.get('x') == b'y'
+                assert p.keys() == ['x']
+                y = p.get('x', memory_map=True)
+                assert p.pop('x') == b'y'
+                assert x == b'x' * 100000 and y == b'y'
+                del x, y
+        """
+    import subprocess
+    import sys
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_memory_map_handle_cache():
+    with File(max_open_files=4) as p:
+        p.append({'x': b'Hello'})
+        x = p.get('x', memory_map=True)
+        assert isinstance(x, memoryview)
+        assert x == b'Hello'
+        del x
+
+
+def test_parallel_get():
+    with File(nthreads=4) as p:
+        data = {('x', i): str(i).encode() * i for i in range(50)}
+        p.append(data)
+        p.append(data)
+        keys = list(data)[::-1] + ['missing']
+        assert p.get(keys) == [data[k] * 2 for k in keys[:-1]] + [b'']
+        assert p.get(keys[:3], memory_map=True) == [data[k] * 2
+                                                    for k in keys[:3]]
+        assert pickle.loads(pickle.dumps(p)).nthreads == 4
+
+
+def test_parallel_get_handle_cache():
+    with File(nthreads=4, max_open_files=8) as p:
+        data = {i: str(i).encode() for i in range(20)}
+        p.append(data)
+        assert p.get(list(data)) == list(data.values())
+
+
+def test_append_lists_and_fsync():
+    for kwargs in [{}, {'max_open_files': 2}, {'nthreads': 4}]:
+        with File(**kwargs) as p:
+            p.append({'x': [b'Hel', b'lo'], ('a', 'b'): [b'abc']},
+                     fsync=True)
+            p.append({'x': b'World!', ('a', 'b'): [memoryview(b'def'), b'']},
+                     fsync=True)
+            assert p.get(['x', ('a', 'b')]) == [b'HelloWorld!', b'abcdef']
+
+
+def test_fanout():
+    with File(fanout=2) as p:
+        data = {'x': b'Hello', ('a', 'b'): b'abc', 1: b'1'}
+        p.append(data)
+        p.append(data)
+        assert p.get(list(data)) == [v * 2 for v in data.values()]
+        for key in data:
+            fn = p.filename(key)
+            assert os.path.exists(fn)
+            assert len(os.path.relpath(fn, p.path).split(os.path.sep)) > 2
+        assert p.filename(('a', 'b')) == filename(p.path, ('a', 'b'), 2)
+        assert p.filename(('a', 'b')).endswith(os.path.join('a', 'b'))
+        assert os.path.exists(os.path.join(p.path, '.lock'))
+
+        p.delete(['x'])
+        assert p.get('x') == b''
+        p.drop()
+        assert p.get(('a', 'b')) == b''
+        p.append(data)
+        assert pickle.loads(pickle.dumps(p)).get(1) == b'1'
+
+
+def test_fanout_bounds():
+    with pytest.raises(ValueError):
+        File(fanout=5)
+
+
+def test_striped_locks():
+    with File(nlocks=4) as p:
+        p.append({'x': b'Hello', ('a', 'b'): b'abc'})
+        p.append({'x': b'World!', ('a', 'b'): b'def'})
+        assert p.get(['x', ('a', 'b')]) == [b'HelloWorld!', b'abcdef']
+        p.iset('i', b'123')
+        p.delete(['x'])
+        assert p.get(['x', 'i']) == [b'', b'123']
+
+        with p.lock:  # all stripes
+            assert p.get('i', lock=False) == b'123'
+
+        p.drop()
+        assert p.get(('a', 'b')) == b''
+        assert sorted(os.listdir(p.path)) == ['.lock-%d' % i for i in range(4)]
+        assert pickle.loads(pickle.dumps(p)).nlocks == 4
+    assert not os.path.exists(p.path)
+
+
+def test_striped_locks_disjoint_keys():
+    with File(nlocks=4) as p:
+        stripes = {}
+        for i in range(100):
+            stripes.setdefault(p.lock.stripe(str(i)), str(i))
+        a, b = list(stripes.values())[:2]
+
+        q = File(p.path, nlocks=4)
+        q._acquire([a])
+        try:
+            p.append({b: b'1'})  # different stripe, does not block
+
+            t = Thread(target=p.append, args=({a: b'2'},))
+            t.start()
+            t.join(0.2)
+            assert t.is_alive()  # same stripe, blocks
+        finally:
+            q._release([a])
+        t.join()
+        assert p.get([a, b]) == [b'2', b'1']
+
+
+def test_concurrent_gets_share_lock():
+    with File() as p:
+        p.append({'x': b'123'})
+        p.lock.acquire(shared=True)
+        try:
+            t = Thread(target=p.get, args=(['x'],))
+            t.start()
+            t.join(0.2)
+            assert not t.is_alive()  # readers proceed together
+
+            t = Thread(target=p.append, args=({'x': b'456'},))
+            t.start()
+            t.join(0.2)
+            assert t.is_alive()  # writers wait
+        finally:
+            p.lock.release()
+        t.join()
+        assert p.get('x') == b'123456'
+
+
+def test_write_behind():
+    with File(write_behind=2, max_inflight=100) as p:
+        for i in range(50):
+            p.append({'x': b'Hello', i % 5: str(i).encode()})
+        assert p.get('x') == b'Hello' * 50
+        assert p.get(3) == b''.join(str(i).encode() for i in range(3, 50, 5))
+
+        p.append({'y': b'abc'}, fsync=True)
+        assert p.get('y') == b'abc'
+
+        p.append({'z': b'1'})
+        p.delete(['z'])
+        assert p.get('z') == b''
+
+        p.append({'z': b'1'})
+        p.sync()
+        with p.lock:
+            assert p.get('z', lock=False) == b'1'
+
+        q = pickle.loads(pickle.dumps(p))
+        assert q.write_behind == 2
+        assert q.get('y') == b'abc'
+        q._writer.close()
+
+
+def test_iter_chunks():
+    with File() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        assert list(p.iter_chunks('x', blocksize=4)) == [b'Hell', b'oWor',
+                                                         b'ld!']
+        assert list(p.iter_chunks('y')) == [b'abc']
+        assert list(p.iter_chunks('z')) == []
+
+        chunks = p.iter_chunks('x', blocksize=4)
+        assert next(chunks) == b'Hell'
+        p.append({'x': b'more'})  # not seen by ongoing iteration
+        assert b''.join(chunks) == b'oWorld!'
+
+
+def test_async():
+    import asyncio
+
+    async def f(p):
+        await asyncio.gather(*[p.aappend({i % 4: b'1'}) for i in range(20)])
+        assert await p.aget([0, 1, 2, 3]) == [b'11111'] * 4
+        await p.adelete(0)
+        assert await p.aget(0) == b''
+        await p.adrop()
+        assert await p.aget(1) == b''
+
+    with File() as p:
+        asyncio.run(f(p))
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'fanout': 2}, {'nlocks': 4}])
+def test_keys_and_nbytes(kwargs):
+    with File(**kwargs) as p:
+        p.append({'x': b'Hello', ('a', 'b'): b'abc', 1: b''})
+        p.append({'x': b'World!'})
+        assert sorted(p.keys(), key=str) == [('a', 'b'), '1', 'x']
+        assert p.nbytes(['x', ('a', 'b'), 'z']) == [11, 3, 0]
+        assert p.nbytes('x') == 11
+        assert p.stats() == {'nkeys': 3, 'nbytes': 14}
+        p.drop()
+        assert p.keys() == []
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'max_open_files': 4}, {'nlocks': 4}])
+def test_pop(kwargs):
+    with File(**kwargs) as p:
+        p.append({'x': b'Hello', ('a', 'b'): b'abc', 'y': b'1'})
+        p.append({'x': b' World!'})
+        assert p.pop(['x', ('a', 'b'), 'z']) == \
+            [b'Hello World!', b'abc', b'']
+        assert p.get(['x', ('a', 'b')]) == [b'', b'']
+        assert p.keys() == ['y']
+        assert p.pop('y') == b'1'
+        p.append({'x': b'again'})
+        assert p.get('x') == b'again'
+
+
+def test_filename_memo_is_bounded(monkeypatch):
+    import partd.file
+    monkeypatch.setattr(partd.file, 'max_filenames', 10)
+    with File() as p:
+        p.append({i: b'x' for i in range(20)})
+        assert not p._filenames
+    with File(max_open_files=4) as p:
+        p.append({i: b'x' for i in range(25)})
+        assert 0 < len(p._filenames) <= 10
+        assert p.get(list(range(25))) == [b'x'] * 25
+        p.drop()
+        assert not p._filenames
+
+
+@pytest.mark.parametrize('max_open_files', [100, 4])
+def test_threaded_get_with_handle_cache(max_open_files):
+    from concurrent.futures import ThreadPoolExecutor
+    data = {i: bytes([i]) * 200000 for i in range(8)}
+    with File(max_open_files=max_open_files) as p:
+        p.append(data)
+
+        def work(i):
+            for j in range(20):
+                p.append({('other', i, j): b'x'})  # churns the cache
+                assert p.get(list(data)) == list(data.values())
+
+        with ThreadPoolExecutor(8) as e:
+            list(e.map(work, range(8)))
+
+
+def test_write_behind_collected_while_writing():
+    from threading import Event
+    started, release = Event(), Event()
+
+    class SlowFile(File):
+        def _append(self, data, **kwargs):
+            started.set()
+            release.wait()
+            return File._append(self, data, **kwargs)
+
+    p = SlowFile(write_behind=1)
+    writer, path = p._writer, p.path
+    p.append({'x': b'1'})
+    p.append({'y': b'2'})  # queued behind the first
+    started.wait()
+    del p  # the writer thread now holds the last reference
+    release.set()
+    for t in writer._threads:
+        t.join(timeout=10)
+        assert not t.is_alive()
+    assert not os.path.exists(path)
+
+
+def test_write_behind_without_lock():
+    from threading import Thread
+    with File(write_behind=1) as p:
+        def run():
+            with p.lock:
+                p.append({'x': b'1'}, lock=False)
+                assert p.get('x', lock=False) == b'1'
+                p.delete(['x'], lock=False)
+        t = Thread(target=run, daemon=True)
+        t.start()
+        t.join(timeout=10)
+        assert not t.is_alive()
+        assert p.get('x') == b''
+
+
+def test_write_behind_copies_data():
+    with File(write_behind=1) as p:
+        data = {'x': b'1'}
+        p.append(data)
+        data['y'] = b'2'
+        p.sync()
+        assert p.get(['x', 'y']) == [b'1', b'']
@@ -0,0 +1,84 @@
+import os
+from threading import Thread
+
+import pytest
+
+from partd.locks import RWLock, FileLock, StripedLock, file_lock, fcntl
+from partd.utils import tmpfile
+
+
+def blocks(func, *args):
+    """ Whether func(*args) is still waiting after a short while """
+    t = Thread(target=func, args=args, daemon=True)
+    t.start()
+    t.join(0.2)
+    return t, t.is_alive()
+
+
+def check_shared_exclusive(a, b):
+    """ a and b are two handles onto the same underlying lock """
+    a.acquire(shared=True)
+    t, alive = blocks(b.acquire, True)
+    assert not alive  # readers share
+    b.release()
+
+    t, alive = blocks(b.acquire)
+    assert alive  # writers wait for readers
+    a.release()
+    t.join()
+
+    t, alive = blocks(a.acquire, True)
+    assert alive  # readers wait for writers
+    b.release()
+    t.join()
+    a.release()
+
+
+def test_rwlock():
+    lock = RWLock()
+    check_shared_exclusive(lock, lock)
+
+
+def test_rwlock_writer_preference():
+    lock = RWLock()
+    lock.acquire(shared=True)
+    writer, alive = blocks(lock.acquire)
+    assert alive
+    reader, alive = blocks(lock.acquire, True)
+    assert alive  # a waiting writer holds back new readers
+    lock.release()
+    writer.join()
+    lock.release()
+    reader.join()
+    lock.release()
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_file_lock():
+    with tmpfile() as fn:
+        check_shared_exclusive(FileLock(fn), FileLock(fn))
+        assert os.path.exists(fn)
+
+
+def test_file_lock_exclusive():
+    with tmpfile() as fn:
+        a, b = file_lock(fn), file_lock(fn)
+        with a:
+            t, alive = blocks(b.acquire)
+            assert alive
+        t.join()
+        b.release()
+
+
+def test_striped_lock_shared():
+    lock = StripedLock([RWLock() for i in range(4)])
+    lock.acquire(['x'], shared=True)
+    t, alive = blocks(lock.acquire, ['x'], True)
+    assert not alive
+    lock.release(['x'])
+
+    t, alive = blocks(lock.acquire)
+    assert alive  # all stripes, exclusive
+    lock.release(['x'])
+    t.join()
+    lock.release()
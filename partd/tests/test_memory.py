@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from partd import Buffer, Dict
+from partd.memory import (AdaptiveMemory, cgroup_dir, cgroup_memory,
+                          process_rss)
+
+
+def write_cgroup(path, current, limit, inactive_file=0):
+    with open(os.path.join(path, 'memory.current'), 'w') as f:
+        f.write('%d\n' % current)
+    with open(os.path.join(path, 'memory.max'), 'w') as f:
+        f.write('max\n' if limit is None else '%d\n' % limit)
+    with open(os.path.join(path, 'memory.stat'), 'w') as f:
+        f.write('anon 100\ninactive_file %d\nactive_file 10\n' % inactive_file)
+
+
+def test_cgroup_memory(tmpdir):
+    root = str(tmpdir)
+    os.makedirs(os.path.join(root, 'a', 'b'))
+    write_cgroup(os.path.join(root, 'a', 'b'), 1000, 5000, inactive_file=300)
+    proc = os.path.join(root, 'cgroup')
+    with open(proc, 'w') as f:
+        f.write('0::/a/b\n')
+    path = cgroup_dir(root, proc)
+    assert path == os.path.join(root, 'a', 'b')
+    assert cgroup_memory(path) == (700, 5000)
+
+    write_cgroup(path, 1000, None)
+    assert cgroup_memory(path) == (1000, None)
+    assert cgroup_dir(os.path.join(root, 'missing'), proc) is None
+
+
+def test_process_rss():
+    if not os.path.exists('/proc/self/statm'):
+        pytest.skip('needs /proc')
+    assert process_rss() > 0
+
+
+def test_adaptive_hysteresis(tmpdir):
+    path = str(tmpdir)
+    write_cgroup(path, 0, 10000)
+    m = AdaptiveMemory(high=0.8, low=0.6, minimum=100, interval=0,
+                       cgroup=path)
+    m.measure = lambda: int(cgroup_memory(path)[0])
+    assert m.limit == 10000
+
+    assert m.update(0) == 8000  # start with the room below high
+    write_cgroup(path, 5000, 10000)
+    assert m.update(0) == 8000  # below low we only grow
+    write_cgroup(path, 7000, 10000)
+    assert m.update(3000) == 8000  # between low and high, hold
+    write_cgroup(path, 9000, 10000)
+    assert m.update(3000) == 2000  # shed the excess above high
+    write_cgroup(path, 9900, 10000)
+    assert m.update(500) == 100  # but never below minimum
+    assert m.stats()['used'] == 9900
+
+
+def test_start_between_low_and_high(tmpdir):
+    m = AdaptiveMemory(limit=10000, minimum=100, interval=0,
+                       cgroup=str(tmpdir))
+    m.measure = lambda: 7000
+    assert m.update(500) == 1500  # what we hold and the room below high
+    assert m.update(1000) == 1500  # then hold
+    m.measure = lambda: 5000
+    assert m.update(1000) == 2000  # and grow below low
+
+
+def test_unmeasured_memory(tmpdir):
+    m = AdaptiveMemory(limit=10000, minimum=100, interval=0,
+                       cgroup=str(tmpdir))
+    m.measure = lambda: None
+    assert m.update(0) == 6000  # low * limit, not minimum
+    m = AdaptiveMemory(limit=10000, maximum=5000, interval=0,
+                       cgroup=str(tmpdir))
+    m.measure = lambda: None
+    assert m.update(0) == 5000
+
+
+def test_buffer_spills_under_pressure(tmpdir):
+    path = str(tmpdir)
+    write_cgroup(path, 0, 10000)
+    m = AdaptiveMemory(minimum=0, interval=0, cgroup=path)
+    m.measure = lambda: int(cgroup_memory(path)[0])
+    with Buffer(Dict(), Dict(), available_memory=m) as p:
+        p.append({'x': b'x' * 1000})
+        assert p.memory_usage == 1000
+        write_cgroup(path, 9000, 10000)
+        p.append({'y': b'y' * 10})
+        assert p.memory_usage <= 10
+        assert p.get('x') == b'x' * 1000
+        assert p.stats()['adaptive']['budget'] == p.budget()
+
+
+def test_bad_watermarks():
+    with pytest.raises(ValueError):
+        AdaptiveMemory(limit=100, high=0.5, low=0.9)
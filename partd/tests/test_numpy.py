@@ -68,3 +68,78 @@ def test_non_utf8_bytes():
                   b'\xf0\x28\x8c\xbc'], dtype='O')
     s = partd.numpy.serialize(a)
     assert (partd.numpy.deserialize(s, 'O') == a).all()
+
+
+def test_memory_map():
+    with Numpy() as p:
+        p.append({'x': np.arange(5), 'y': np.array(['a', 'b'], dtype='O')})
+        p.append({'x': np.arange(5)})
+        x, y = p.get(['x', 'y'], memory_map=True)
+        assert not x.flags.writeable
+        assert not x.flags.owndata
+        assert (x == np.concatenate([np.arange(5)] * 2)).all()
+        assert list(y) == ['a', 'b']
+        del x
+
+
+def test_iter_chunks():
+    with Numpy(partd.File()) as p:
+        p.append({'x': np.arange(5), 'y': np.array(['a', 'b'], dtype='O'),
+                  'z': array_of_lists})
+        p.append({'x': np.arange(5, 10), 'y': np.array(['c'], dtype='O'),
+                  'z': array_of_lists})
+
+        chunks = list(p.iter_chunks('x', blocksize=12))
+        assert len(chunks) > 2
+        assert all(c.dtype == np.arange(1).dtype for c in chunks)
+        assert (np.concatenate(chunks) == np.arange(10)).all()
+
+        chunks = list(p.iter_chunks('y'))
+        assert [list(c) for c in chunks] == [['a', 'b'], ['c']]
+        chunks = list(p.iter_chunks('z'))
+        assert len(chunks) == 2
+        assert (chunks[1] == array_of_lists).all()
+
+        assert list(p.iter_chunks('missing')) == []
+
+
+def test_keys_and_nbytes():
+    with partd.Numpy() as p:
+        p.append({'a': np.arange(5), ('b', 'c'): np.ones(3, 'f4')})
+        assert p.keys() == ['a', ('b', 'c')]
+        assert p.nbytes(['a', ('b', 'c')]) == [40, 12]
+        assert p.stats() == {'nkeys': 2, 'nbytes': 52}
+
+
+def test_pop():
+    with partd.Numpy() as p:
+        p.append({'a': np.arange(5), 'b': np.array(['x', 'y'], dtype='O')})
+        a, b = p.pop(['a', 'b'])
+        assert (a == np.arange(5)).all()
+        assert b.tolist() == ['x', 'y']
+        assert p.keys() == []
+
+        p.append({'a': np.arange(3)})  # sets the dtype again
+        assert (p.get('a') == np.arange(3)).all()
+
+
+def test_pop_and_delete_through_buffer():
+    with partd.Numpy(partd.Buffer(partd.Dict(), partd.File())) as p:
+        p.append({'x': np.arange(3)})
+        p.pop('x')
+        p.append({'x': np.arange(2)})
+        assert (p.get('x') == np.arange(2)).all()
+
+        p.delete(['x'])
+        p.append({'x': np.array([1.5])})
+        assert p.get('x').dtype == 'f8'
+
+
+def test_object_dtype_mixed_and_untagged_frames():
+    import pickle
+    from partd.utils import frame
+    data = (frame(pickle.dumps(['a', 'b'])) +  # written by older versions
+            partd.numpy.serialize(np.array([1j], dtype='O')) +
+            partd.numpy.serialize(np.array(['c'], dtype='O')))
+    result = partd.numpy.deserialize(data, 'O')
+    assert result.tolist() == ['a', 'b', 1j, 'c']
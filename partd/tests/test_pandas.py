@@ -73,6 +73,16 @@ def test_PandasBlocks():
     assert not os.path.exists(p.partd.path)
 
 
+def test_PandasBlocks_iter_chunks():
+    with PandasBlocks() as p:
+        p.append({'x': df1})
+        p.append({'x': df2})
+        chunks = list(p.iter_chunks('x', blocksize=100))
+        assert len(chunks) == 2
+        tm.assert_frame_equal(chunks[0], df1)
+        tm.assert_frame_equal(chunks[1], df2)
+
+
 @pytest.mark.parametrize('ordered', [False, True])
 def test_serialize_categoricals(ordered):
     frame = pd.DataFrame({'x': [1, 2, 3, 4],
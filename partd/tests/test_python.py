@@ -5,6 +5,8 @@ import os
 import shutil
 from math import sin
 
+import pytest
+
 
 def test_pack_unpack():
     data = [1, 2, b'Hello', 'Hello']
@@ -12,3 +14,30 @@ def test_pack_unpack():
 
     data = [1, 2, sin]
     assert loads(dumps(data)) == data
+
+
+def test_tagged():
+    from partd.python import header, MSGPACK, PICKLE
+    assert dumps([1, 2])[:3] == header(MSGPACK)
+    assert dumps([1, 2, sin])[:3] == header(PICKLE)
+    assert loads(memoryview(dumps([1, 2, sin]))) == [1, 2, sin]
+
+
+def test_untagged():
+    import pickle
+    msgpack = pytest.importorskip('msgpack')
+    assert loads(msgpack.packb([1, b'Hello', 'Hello'], use_bin_type=True)) == \
+        [1, b'Hello', 'Hello']
+    assert loads(msgpack.packb(0)) == 0
+    assert loads(pickle.dumps([1, sin])) == [1, sin]
+    assert loads(pickle.dumps([1, sin], protocol=0)) == [1, sin]
+
+
+def test_mixed_formats():
+    from partd.python import Python
+    from partd.dict import Dict
+    with Python(Dict()) as p:
+        p.append({'x': [1, 2]})
+        p.append({'x': [sin]})
+        p.append({'x': [3]})
+        assert p.get('x') == [1, 2, sin, 3]
@@ -0,0 +1,196 @@
+from partd.segment import SegmentFile
+
+import os
+import pickle
+
+
+def test_partd():
+    with SegmentFile() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!', 'y': b'def'})
+
+        result = p.get(['y', 'x'])
+        assert result == [b'abcdef', b'HelloWorld!']
+
+        assert p.get('z') == b''
+
+        with p.lock:  # uh oh, possible deadlock
+            result = p.get(['x'], lock=False)
+
+        assert len(os.listdir(p.path)) < 5
+
+    assert not os.path.exists(p.path)
+
+
+def test_key_tuple():
+    with SegmentFile() as p:
+        p.append({('a', 'b'): b'123', ('a', 1): b'456'})
+        assert p.get(('a', 'b')) == b'123'
+        assert p.get(('a', 1)) == b'456'
+
+
+def test_iset():
+    with SegmentFile() as p:
+        p.iset('x', b'123')
+        assert 'x' in p._iset_seen
+        p.iset('x', b'123')
+        assert p.get('x') == b'123'
+
+
+def test_nested_get():
+    with SegmentFile() as p:
+        p.append({'x': b'1', 'y': b'2', 'z': b'3'})
+        assert p.get(['x', ['y', 'z']]) == [b'1', [b'2', b'3']]
+
+
+def test_delete():
+    with SegmentFile() as p:
+        p.append({'x': b'123', 'y': b'456'})
+        p.delete(['x', 'z'])
+        assert p.get(['x', 'y']) == [b'', b'456']
+        assert p.garbage == 3
+
+
+def test_drop():
+    with SegmentFile() as p:
+        p.append({'x': b'123'})
+        p.iset('y', b'abc')
+        p.drop()
+        assert p.get(['x', 'y']) == [b'', b'']
+
+        p.append({'x': b'123'})
+        p.iset('y', b'def')
+        assert p.get(['x', 'y']) == [b'123', b'def']
+
+
+def test_segment_rollover():
+    with SegmentFile(segment_size=10) as p:
+        for i in range(10):
+            p.append({'x': b'0123456789', 'y': b'ab'})
+        assert p.active > 5
+        assert p.get('x') == b'0123456789' * 10
+        assert p.get('y') == b'ab' * 10
+
+
+def test_compact():
+    with SegmentFile(segment_size=100) as p:
+        for i in range(20):
+            p.append({'x': b'0123456789', 'y': b'abcdefghij'})
+        p.delete(['y'])
+        before = sum(os.path.getsize(os.path.join(p.path, fn))
+                     for fn in os.listdir(p.path) if fn.endswith('.segment'))
+
+        p.compact()
+
+        after = sum(os.path.getsize(os.path.join(p.path, fn))
+                    for fn in os.listdir(p.path) if fn.endswith('.segment'))
+        assert after == 200 < before
+        assert p.garbage == 0
+        assert p.index['x'] == [(p.active, 0, 200)]
+        assert p.get(['x', 'y']) == [b'0123456789' * 20, b'']
+
+        p.append({'x': b'!'})
+        assert p.get('x') == b'0123456789' * 20 + b'!'
+
+
+def test_compact_empty():
+    with SegmentFile() as p:
+        p.append({'x': b'abc'})
+        p.delete(['x'])
+        p.compact()
+        p.compact()
+        assert not [fn for fn in os.listdir(p.path)
+                    if fn.endswith('.segment')]
+        p.append({'x': b'def'})
+        assert p.get('x') == b'def'
+
+
+def test_compact_holds_one_value_at_a_time():
+    import tracemalloc
+    with SegmentFile() as p:
+        for i in range(20):
+            p.append({i: b'x' * 2**20})
+        tracemalloc.start()
+        try:
+            p.compact()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < 4 * 2**20
+        assert p.get(list(range(20))) == [b'x' * 2**20] * 20
+
+
+def test_shared_directory():
+    with SegmentFile() as p:
+        q = SegmentFile(p.path)
+        p.append({'x': b'123'})
+        q.append({'x': b'456', 'y': b'abc'})
+        assert p.get(['x', 'y']) == [b'123456', b'abc']
+
+        q.delete(['y'])
+        assert p.get('y') == b''
+
+        q.compact()
+        p.append({'x': b'789'})
+        assert q.get('x') == b'123456789'
+
+
+def test_pickle():
+    with SegmentFile() as p:
+        p.append({'x': b'123'})
+        q = pickle.loads(pickle.dumps(p))
+        assert q.get('x') == b'123'
+        assert q.segment_size == p.segment_size
+
+
+def test_append_lists_and_fsync():
+    with SegmentFile() as p:
+        p.append({'x': [b'Hel', b'lo'], 'y': [b'abc']}, fsync=True)
+        p.append({'x': b'World!', 'y': [memoryview(b'def'), b'']},
+                 fsync=True)
+        assert p.get(['x', 'y']) == [b'HelloWorld!', b'abcdef']
+        assert p._synced == p._written == 2
+        assert not p._dirty
+
+
+def test_group_commit():
+    from concurrent.futures import ThreadPoolExecutor
+    with SegmentFile() as p:
+        with ThreadPoolExecutor(8) as e:
+            list(e.map(lambda i: p.append({i: b'x' * i}, fsync=True),
+                       range(50)))
+        assert p._synced == 50
+        assert p.get(list(range(50))) == [b'x' * i for i in range(50)]
+        p.sync()
+
+
+def test_iter_chunks():
+    with SegmentFile() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': b'World!'})
+        chunks = p.iter_chunks('x')
+        assert next(chunks) == b'Hello'
+        p.compact()
+        assert list(chunks) == [b'World!']
+        assert list(p.iter_chunks('x')) == [b'HelloWorld!']
+        assert list(p.iter_chunks('z')) == []
+
+
+def test_keys_and_nbytes():
+    with SegmentFile() as p:
+        p.append({'x': b'Hello', ('a', 1): b'abc'})
+        p.append({'x': b'World!'})
+        p.iset('y', b'12')
+        p.delete(['y'])
+        assert p.keys() == ['x', ('a', 1)]
+        assert p.nbytes(['x', ('a', 1), 'y']) == [11, 3, 0]
+        assert p.stats() == {'nkeys': 2, 'nbytes': 14, 'garbage': 2,
+                             'nsegments': 1}
+
+
+def test_pop():
+    with SegmentFile() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        assert p.pop(['x']) == [b'Hello']
+        assert p.keys() == ['y']
+        assert p.garbage == 5
@@ -0,0 +1,105 @@
+import pytest
+pytest.importorskip('multiprocessing.shared_memory')
+
+from partd.sharedmemory import SharedMemory
+
+from multiprocessing import get_context
+import pickle
+
+
+def test_partd():
+    with SharedMemory() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'x': [b'World', b'!'], 'y': b'def'})
+
+        result = p.get(['y', 'x'])
+        assert result == [b'abcdef', b'HelloWorld!']
+
+        assert p.get('z') == b''
+
+        with p.lock:  # uh oh, possible deadlock
+            result = p.get(['x'], lock=False)
+
+
+def test_key_tuple():
+    with SharedMemory() as p:
+        p.append({('a', 'b'): b'123', ('a', 1): b'456'})
+        assert p.get(('a', 'b')) == b'123'
+        assert p.get(('a', 1)) == b'456'
+
+
+def test_iset_delete_pop():
+    with SharedMemory() as p:
+        p.iset('x', b'123')
+        p.iset('x', b'123')
+        assert p.get('x') == b'123'
+        p.append({'y': b'abc', 'z': b'!'})
+        p.delete(['y', 'w'])
+        assert p.pop(['z']) == [b'!']
+        assert p.get(['x', 'y', 'z']) == [b'123', b'', b'']
+        assert p.keys() == ['x']
+        assert p.nbytes('x') == 3
+        assert p.stats()['garbage'] == 4
+
+
+def test_get_without_copy():
+    with SharedMemory() as p:
+        p.append({'x': b'Hello', 'y': b'abc'})
+        p.append({'y': b'def'})
+        x, y = p.get(['x', 'y'], copy=False)
+        assert isinstance(x, memoryview) and x.readonly
+        assert x == b'Hello'
+        assert y == b'abcdef'
+        del x
+
+
+def test_compaction():
+    with SharedMemory(size=100, index_size=2000) as p:
+        p.append({'x': b'0123456789'})
+        for i in range(20):
+            p.append({'y': b'0123456789'})
+            p.delete(['y'])
+        assert p.get('x') == b'0123456789'
+        assert p.stats()['nbytes'] == 10
+        with pytest.raises(MemoryError):
+            p.append({'z': b'!' * 100})
+        assert p.get('x') == b'0123456789'
+
+
+def test_drop():
+    with SharedMemory() as p:
+        q = SharedMemory(p.name)
+        p.append({'x': b'123'})
+        q.drop()
+        assert p.get('x') == b''
+        p.append({'x': b'456'})
+        assert q.get('x') == b'456'
+
+
+def test_pickle():
+    with SharedMemory() as p:
+        p.append({'x': b'123'})
+        q = pickle.loads(pickle.dumps(p))
+        q.append({'x': b'456'})
+        assert p.get('x') == b'123456'
+        q.close()
+        assert p.get('x') == b'123456'
+
+
+def append_range(p, i):
+    for j in range(10):
+        p.append({'x': b'%d' % i, ('y', i): b'a'})
+
+
+def test_processes():
+    with SharedMemory() as p:
+        ctx = get_context('spawn')
+        procs = [ctx.Process(target=append_range, args=(p, i))
+                 for i in range(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+            assert proc.exitcode == 0
+        assert sorted(p.get('x')) == sorted(b'0123' * 10)
+        assert p.get([('y', i) for i in range(4)]) == [b'a' * 10] * 4
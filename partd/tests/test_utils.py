@@ -9,3 +9,33 @@ def test_frame():
 def test_framesplit():
     L = [b'Hello', b'World!', b'123']
     assert list(framesplit(b''.join(map(frame, L)))) == L
+
+
+def test_writev():
+    from partd.utils import writev, nbytes, IOV_MAX, tmpfile
+    buffers = [str(i).encode() for i in range(IOV_MAX * 2 + 5)]
+    buffers.append(memoryview(b'end'))
+    with tmpfile() as fn:
+        with open(fn, 'wb') as f:
+            f.write(b'start')
+            writev(f, buffers)
+            writev(f, b'!')
+        with open(fn, 'rb') as f:
+            assert f.read() == b'start' + b''.join(buffers) + b'!'
+    assert nbytes(buffers) == len(b''.join(buffers))
+
+
+def test_framev():
+    from partd.utils import framev
+    data = memoryview(b'Hello')
+    header, payload = framev(data)
+    assert payload is data
+    assert header + payload == frame(b'Hello')
+
+
+def test_framesplit_does_not_copy():
+    data = bytearray(frame(b'Hello') + frame(b'World'))
+    frames = list(framesplit(data))
+    assert all(isinstance(f, memoryview) for f in frames)
+    data[8:13] = b'Howdy'
+    assert frames[0] == b'Howdy'
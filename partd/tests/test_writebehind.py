@@ -0,0 +1,55 @@
+from threading import Event
+
+import pytest
+
+from partd.dict import Dict
+from partd.writebehind import WriteBehind
+
+
+def test_write_behind():
+    d = Dict()
+    w = WriteBehind(d.append, nthreads=3)
+    for i in range(100):
+        w.put({'x': str(i).encode(), i % 7: b'!'})
+    w.wait(['x'])
+    assert d.get('x') == b''.join(str(i).encode() for i in range(100))
+    w.wait()
+    assert w.pending == w.nbytes == 0
+    assert not w.inflight
+    assert d.get(3) == b'!' * len(range(3, 100, 7))
+    w.close()
+
+
+def test_backpressure():
+    release = Event()
+    written = []
+
+    def write(data):
+        release.wait()
+        written.append(data)
+
+    w = WriteBehind(write, max_bytes=10)
+    w.put({'x': b'0123456789'})  # always admit one batch
+    assert w.nbytes == 10
+
+    from threading import Thread
+    t = Thread(target=w.put, args=({'y': b'1'},))
+    t.start()
+    t.join(0.2)
+    assert t.is_alive()  # blocked, too many bytes in flight
+
+    release.set()
+    t.join()
+    w.close()
+    assert written == [{'x': b'0123456789'}, {'y': b'1'}]
+
+
+def test_errors_propagate():
+    def write(data):
+        raise ValueError('bad')
+
+    w = WriteBehind(write)
+    w.put({'x': b'1'})
+    with pytest.raises(ValueError):
+        w.wait()
+    w.close()
@@ -125,3 +125,39 @@ def dont_test_server_autocreation():
     with Client() as p:
         p.append({'x': b'123'})
         assert p.get('x') == b'123'
+
+
+def test_async():
+    import asyncio
+
+    async def f(p):
+        await asyncio.gather(*[p.aappend({'x': b'1', ('a', i % 3): b'2'})
+                               for i in range(30)])
+        assert await p.aget('x') == b'1' * 30
+        assert await p.aget([('a', 0), ['x']]) == [b'2' * 10, [b'1' * 30]]
+        await p.adelete('x')
+        assert await p.aget('x') == b''
+        await p.adrop()
+        assert await p.aget(('a', 1)) == b''
+
+    with partd_server() as (p, server):
+        asyncio.run(f(p))
+        p.append({'y': b'sync'})  # sync socket unaffected
+        assert p.get('y') == b'sync'
+
+
+def test_keys_and_nbytes():
+    with partd_server() as (p, server):
+        p.append({'x': b'Hello', ('a', 'b'): b'abc'})
+        p.append({'x': b'World!'})
+        assert sorted(p.keys(), key=str) == [(b'a', b'b'), b'x']
+        assert p.nbytes([b'x', ('a', 'b'), 'z']) == [11, 3, 0]
+        assert p.stats()['nbytes'] == 14
+
+
+def test_pop():
+    with partd_server() as (p, server):
+        p.append({'x': b'Hello', ('a', 'b'): b'abc'})
+        p.append({'x': b'World!'})
+        assert p.pop(['x', ('a', 'b')]) == [b'HelloWorld!', b'abc']
+        assert p.get('x') == b''
@@ -0,0 +1,142 @@
+""" Apply appends on background threads """
+from collections import defaultdict
+from queue import Queue
+from threading import Condition, Thread, current_thread
+
+from .utils import nbytes
+
+
+class WriteBehind:
+    """ Hand appends to background threads with bounded memory
+
+    ``put`` returns as soon as its data is queued, unless more than
+    ``max_bytes`` are already waiting to be written, in which case it blocks
+    until the writers catch up.  Each key always goes to the same thread, so
+    appends to a key are written in the order in which they were put.
+
+    Errors raised while writing are re-raised by the next ``put`` or
+    ``wait``.
+
+    Parameters
+    ----------
+    write: callable
+        Function that writes a dict of data, called on background threads
+    nthreads: int
+        Number of writer threads
+    max_bytes: int
+        Block producers while more than this many bytes are in flight
+
+    Examples
+    --------
+    >>> from partd import Dict
+    >>> d = Dict()
+    >>> w = WriteBehind(d.append, nthreads=2)
+    >>> w.put({'x': b'Hello', 'y': b'abc'})
+    >>> w.put({'x': b' World'})
+    >>> w.wait(['x'])
+    >>> d.get('x')
+    b'Hello World'
+    >>> w.close()
+    """
+    def __init__(self, write, nthreads=1, max_bytes=2**28):
+        self.write = write
+        self.nthreads = nthreads
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.pending = 0
+        self.inflight = defaultdict(int)
+        self.error = None
+        self._cond = Condition()
+        self._queues = [Queue() for i in range(nthreads)]
+        self._threads = [Thread(target=self._run, args=(q,), daemon=True)
+                         for q in self._queues]
+        for t in self._threads:
+            t.start()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def put(self, data):
+        """ Queue a dict of data to be written """
+        if self.nthreads == 1:
+            parts = [dict(data)]  # the caller may reuse data
+        else:
+            parts = [dict() for i in range(self.nthreads)]
+            for k, v in data.items():
+                parts[hash(k) % self.nthreads][k] = v
+        sizes = [sum(map(nbytes, part.values())) for part in parts]
+        total = sum(sizes)
+        with self._cond:
+            self._raise()
+            while self.nbytes and self.nbytes + total > self.max_bytes:
+                self._cond.wait()
+                self._raise()
+            for q, part, size in zip(self._queues, parts, sizes):
+                if not part:
+                    continue
+                self.nbytes += size
+                self.pending += 1
+                for k in part:
+                    self.inflight[k] += 1
+                q.put((part, size))
+
+    def _run(self, queue):
+        while True:
+            task = queue.get()
+            if task is None:
+                return
+            self._write(task)
+
+    def _write(self, task):
+        data, size = task
+        try:
+            self.write(data)
+        except BaseException as e:
+            with self._cond:
+                self.error = e
+        finally:
+            with self._cond:
+                self.nbytes -= size
+                self.pending -= 1
+                for k in data:
+                    self.inflight[k] -= 1
+                    if not self.inflight[k]:
+                        del self.inflight[k]
+                self._cond.notify_all()
+
+    def wait(self, keys=None):
+        """ Block until queued writes, or just those to keys, are written
+
+        Called from within a write, we do not wait for that write itself.
+        """
+        own = int(current_thread() in self._threads)
+        with self._cond:
+            if keys is None:
+                while self.pending > own:
+                    self._cond.wait()
+            else:
+                while any(k in self.inflight for k in keys):
+                    self._cond.wait()
+            self._raise()
+
+    def close(self):
+        """ Write everything that is queued and stop the threads """
+        me = current_thread()
+        if me in self._threads:
+            # Called from within a write, as when that write dropped the last
+            # reference to our owner.  Nobody else will empty our own queue.
+            queue = self._queues[self._threads.index(me)]
+            while not queue.empty():
+                task = queue.get()
+                if task is not None:
+                    self._write(task)
+        try:
+            self.wait()
+        finally:
+            for q in self._queues:
+                q.put(None)
+            for t in self._threads:
+                if t is not current_thread():
+                    t.join()
@@ -1,3 +1,6 @@
+import asyncio
+import json
+import struct
 import zmq
 import logging
 from itertools import chain
@@ -5,7 +8,7 @@ from bisect import bisect
 import socket
 from operator import add
 from time import sleep, time
-from toolz import accumulate, topk, pluck, merge, keymap
+from toolz import accumulate, topk, pluck, merge
 import uuid
 from collections import defaultdict
 from contextlib import contextmanager, suppress
@@ -127,6 +130,34 @@ class Server:
                     self.partd.delete(keys, lock=False)
                     self.ack(address, flow_control=False)
 
+                elif command == b'pop':
+                    keys = list(map(deserialize_key, payload))
+                    with self._lock:
+                        result = self.partd.pop(keys, lock=False)
+                    self.send_to_client(address, result)
+                    self.ack(address, flow_control=False)
+
+                elif command == b'keys':
+                    with self._lock:
+                        keys = self.partd.keys(lock=False)
+                    self.send_to_client(address, list(map(serialize_key, keys)))
+                    self.ack(address, flow_control=False)
+
+                elif command == b'nbytes':
+                    keys = list(map(deserialize_key, payload))
+                    with self._lock:
+                        sizes = self.partd.nbytes(keys, lock=False)
+                    self.send_to_client(address,
+                                        [struct.pack('%dQ' % len(sizes), *sizes)])
+                    self.ack(address, flow_control=False)
+
+                elif command == b'stats':
+                    with self._lock:
+                        stats = self.partd.stats(lock=False)
+                    self.send_to_client(address,
+                                        [json.dumps(stats).encode()])
+                    self.ack(address, flow_control=False)
+
                 elif command == b'syn':
                     self.ack(address)
 
@@ -237,9 +268,12 @@ def deserialize_key(text):
 
 from .core import Interface
 from .file import File
+from .utils import join_buffers
 
 
 class Client(Interface):
+    _append_lists = True
+
     def __init__(self, address=None, create_server=False, **kwargs):
         self.address = address
         self.context = zmq.Context()
@@ -248,6 +282,8 @@ class Client(Interface):
         self.socket.connect(address)
         self.send(b'syn', [], ack_required=False)
         self.lock = NotALock()  # Server sequentializes everything
+        self._async_socket = None
+        self._async_lock = None
         Interface.__init__(self)
 
     def __getstate__(self):
@@ -269,6 +305,47 @@ class Client(Interface):
             result = None
         return result
 
+    async def asend(self, command, payload, recv=False):
+        """ Awaitable ``send`` over a separate ``zmq.asyncio`` socket
+
+        Coroutines take turns on the socket, so many may share one client.
+        Use a client from a single event loop.
+        """
+        if self._async_lock is None:
+            import zmq.asyncio
+            self._async_lock = asyncio.Lock()
+            self._async_context = zmq.asyncio.Context()
+            self._async_socket = self._async_context.socket(zmq.DEALER)
+            self._async_socket.connect(self.address)
+            self._async_ack_required = False
+        async with self._async_lock:
+            if self._async_ack_required:
+                ack = await self._async_socket.recv_multipart()
+                assert ack == [b'ack']
+            logger.debug('Client sends command: %s', command)
+            await self._async_socket.send_multipart([command] + payload)
+            self._async_ack_required = True
+            if recv:
+                return await self._async_socket.recv_multipart()
+
+    async def _aget(self, keys, lock=None):
+        keys = list(map(serialize_key, keys))
+        return await self.asend(b'get', keys, recv=True)
+
+    async def aappend(self, data, lock=None):
+        data = {serialize_key(k): join_buffers(v) for k, v in data.items()}
+        payload = list(chain.from_iterable(data.items()))
+        await self.asend(b'append', payload)
+
+    async def adelete(self, keys, lock=None):
+        if not isinstance(keys, list):
+            keys = [keys]
+        await self.asend(b'delete', list(map(serialize_key, keys)))
+
+    async def adrop(self):
+        await self.asend(b'drop', [])
+        await asyncio.sleep(0.05)
+
     def _get(self, keys, lock=None):
         """
 
@@ -280,7 +357,7 @@ class Client(Interface):
 
     def append(self, data, lock=None):
         logger.debug('Client appends %s %s', self.address, str(len(data)) + ' keys')
-        data = keymap(serialize_key, data)
+        data = {serialize_key(k): join_buffers(v) for k, v in data.items()}
         payload = list(chain.from_iterable(data.items()))
         self.send(b'append', payload)
 
@@ -289,8 +366,28 @@ class Client(Interface):
         keys = list(map(serialize_key, keys))
         self.send(b'delete', keys)
 
+    def _pop(self, keys, lock=None, **kwargs):
+        keys = list(map(serialize_key, keys))
+        return self.send(b'pop', keys, recv=True)
+
+    def keys(self, lock=None):
+        """ Keys held by the server, as bytes or tuples of bytes """
+        return list(map(deserialize_key, self.send(b'keys', [], recv=True)))
+
+    def _empty(self, lock=None):
+        return not self.stats()['nkeys']  # rather than send every key
+
+    def _nbytes(self, keys, lock=None, **kwargs):
+        keys = list(map(serialize_key, keys))
+        [sizes] = self.send(b'nbytes', keys, recv=True)
+        return list(struct.unpack('%dQ' % len(keys), sizes))
+
+    def stats(self, lock=None):
+        [stats] = self.send(b'stats', [], recv=True)
+        return json.loads(stats)
+
     def _iset(self, key, value):
-        self.send(b'iset', [serialize_key(key), value])
+        self.send(b'iset', [serialize_key(key), join_buffers(value)])
 
     def drop(self):
         self.send(b'drop', [])
@@ -308,6 +405,12 @@ class Client(Interface):
             self.socket.close(1)
         with suppress(zmq.error.ZMQError):
             self.context.destroy(1)
+        if getattr(self, '_async_socket', None) is not None:
+            with suppress(zmq.error.ZMQError):
+                self._async_socket.close(1)
+            with suppress(zmq.error.ZMQError):
+                self._async_context.destroy(1)
+            self._async_socket = None
 
     def __exit__(self, type, value, traceback):
         self.drop()
@@ -318,7 +421,7 @@ class Client(Interface):
 
 
 class NotALock:
-    def acquire(self): pass
+    def acquire(self, shared=False): pass
     def release(self): pass
 
     def __enter__(self):